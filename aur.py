@@ -0,0 +1,83 @@
+"""Client for the AUR RPC interface.
+
+A single ``/rpc/v5/info`` request returns the version of any number of
+packages, so a poll costs one small JSON response instead of a page load
+and a PKGBUILD download per package. ``_commit`` is not part of the RPC
+(nor of ``.SRCINFO``), so the PKGBUILD is only fetched from cgit when the
+caller actually needs it.
+"""
+import os
+
+import requests
+
+import metrics
+from http_state import conditional_get, remember
+from net import TIMEOUT
+from pkgbuild import PKGBUILD, PKGBUILDError
+
+# Overridable to point the updater at a mirror or a local stand-in
+AUR_URL = os.environ.get("AUR_URL", "https://aur.archlinux.org").rstrip("/")
+
+# Package names per info request, keeping the query string well within URL limits
+RPC_BATCH_SIZE = 100
+
+
+class AURUnavailableError(Exception):
+    """AUR could not be reached or answered with a server error."""
+
+
+def split_version(version):
+    """Split an AUR ``Version`` (``[epoch:]pkgver-pkgrel``) into (pkgver, pkgrel)."""
+    pkgver, _, pkgrel = version.split(":", 1)[-1].rpartition("-")
+    return (pkgver, pkgrel) if pkgver and pkgrel else (None, None)
+
+
+@metrics.timed("aur_rpc")
+def get_versions(session, pkgnames):
+    """Return ``{pkgname: (pkgver, pkgrel)}``; packages not in the AUR map to (None, None)."""
+    versions = {name: (None, None) for name in pkgnames}
+    names = sorted(versions)
+    for start in range(0, len(names), RPC_BATCH_SIZE):
+        batch = names[start:start + RPC_BATCH_SIZE]
+        url = f"{AUR_URL}/rpc/v5/info"
+        print(f"::debug::Querying AUR RPC for {', '.join(batch)}")
+        try:
+            response = session.get(url, params={"arg[]": batch}, timeout=TIMEOUT)
+            metrics.add_bytes(len(response.content))
+            response.raise_for_status()
+            data = response.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise AURUnavailableError(str(e)) from e
+        if data.get("type") == "error":
+            raise AURUnavailableError(f"AUR RPC error: {data.get('error')}")
+        for result in data.get("results", []):
+            if result.get("Name") in versions:
+                versions[result["Name"]] = split_version(result.get("Version", ""))
+    return versions
+
+
+@metrics.timed("aur_pkgbuild")
+def get_commit(session, pkgname):
+    """Return ``_commit`` from the AUR PKGBUILD of ``pkgname``, or None."""
+    url = f"{AUR_URL}/cgit/aur.git/plain/PKGBUILD?h={pkgname}"
+    try:
+        response, cached = conditional_get(url, session, timeout=TIMEOUT)
+        if cached is not None:
+            print("::debug::AUR PKGBUILD unchanged, using cached commit")
+            return cached[2]
+        if response.status_code == 404:
+            print("::warning::AUR PKGBUILD not found (404)")
+            return None
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        raise AURUnavailableError(str(e)) from e
+
+    try:
+        pkgbuild = PKGBUILD.parse(response.text)
+    except PKGBUILDError as e:
+        print(f"::warning::Failed to parse AUR PKGBUILD: {str(e)}")
+        return None
+    info = [pkgbuild.get("pkgver"), pkgbuild.get("pkgrel"), pkgbuild.get("_commit")]
+    if all(info):
+        remember(url, response, info)
+    return info[2]
@@ -0,0 +1,52 @@
+"""Run an updater script as ``__main__`` and record its own resource usage.
+
+Usage: python bench/_child.py <stats.json> <script.py> [args...]
+
+Peak RSS comes from ``getrusage``; bytes read and written come from
+``/proc/self/io`` (``rchar``/``wchar`` include sockets, ``read_bytes``/
+``write_bytes`` are what actually hit the block layer). Both are sampled
+at exit, so nothing is lost to polling.
+"""
+import json
+import os
+import resource
+import runpy
+import sys
+
+
+def _proc_io():
+    try:
+        with open("/proc/self/io") as f:
+            return {key: int(value) for key, value in (line.split(": ") for line in f)}
+    except OSError:
+        return {}
+
+
+def main():
+    stats_path, script = sys.argv[1], os.path.abspath(sys.argv[2])
+    sys.argv = [script] + sys.argv[3:]
+    sys.path[0] = os.path.dirname(script)
+    exit_code = 0
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    finally:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        io = _proc_io()
+        with open(stats_path, "w") as f:
+            json.dump({
+                "exit_code": exit_code,
+                "max_rss_bytes": usage.ru_maxrss * 1024,
+                "user_seconds": usage.ru_utime,
+                "system_seconds": usage.ru_stime,
+                "rchar": io.get("rchar"),
+                "wchar": io.get("wchar"),
+                "read_bytes": io.get("read_bytes"),
+                "write_bytes": io.get("write_bytes"),
+            }, f)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""Tiny SquashFS 4.0 writer (gzip) for generating synthetic AppImages."""
+import struct
+import time
+import zlib
+
+BLOCK_SIZE = 128 * 1024
+BLOCK_LOG = 17
+METADATA_SIZE = 8192
+
+
+class Dir:
+    def __init__(self, mode=0o755):
+        self.mode = mode
+        self.children = {}
+
+
+class File:
+    def __init__(self, data=b"", mode=0o644, size=None, chunks=None, compress=True):
+        self.data = data
+        self.mode = mode
+        self.size = len(data) if size is None else size
+        self.chunks = chunks
+        self.compress = compress
+
+
+class Symlink:
+    def __init__(self, target):
+        self.target = target
+        self.mode = 0o777
+
+
+def add(root, path, node):
+    parts = path.strip("/").split("/")
+    cur = root
+    for p in parts[:-1]:
+        cur = cur.children.setdefault(p, Dir())
+    cur.children[parts[-1]] = node
+
+
+class _Meta:
+    """Metadata stream that records compressed block starts as it goes."""
+
+    def __init__(self):
+        self.out = bytearray()
+        self.buf = bytearray()
+        self.block_starts = []
+
+    def pos(self):
+        return len(self.block_starts) * METADATA_SIZE + len(self.buf)
+
+    def ref(self, pos):
+        index, offset = divmod(pos, METADATA_SIZE)
+        start = self.block_starts[index] if index < len(self.block_starts) else len(self.out)
+        return start, offset
+
+    def write(self, data):
+        self.buf += data
+        while len(self.buf) >= METADATA_SIZE:
+            self._flush(self.buf[:METADATA_SIZE])
+            del self.buf[:METADATA_SIZE]
+
+    def _flush(self, chunk):
+        self.block_starts.append(len(self.out))
+        packed = zlib.compress(bytes(chunk), 9)
+        if len(packed) < len(chunk):
+            self.out += struct.pack("<H", len(packed)) + packed
+        else:
+            self.out += struct.pack("<H", len(chunk) | 0x8000) + chunk
+
+    def finish(self):
+        if self.buf:
+            self._flush(self.buf)
+            self.buf = bytearray()
+        return bytes(self.out)
+
+
+def write_squashfs(out, root, mtime=None):
+    """Write ``root`` as a SquashFS image to the binary file ``out``."""
+    mtime = int(time.time()) if mtime is None else mtime
+    base = out.tell()
+    out.write(b"\0" * 96)
+
+    # Number inodes depth-first, children before parents, root last.
+    order = []
+
+    def walk(node):
+        if isinstance(node, Dir):
+            for name in sorted(node.children):
+                walk(node.children[name])
+        order.append(node)
+
+    walk(root)
+    numbers = {id(node): i + 1 for i, node in enumerate(order)}
+
+    # Data blocks and fragments
+    fragments = []
+    frag_buf = bytearray()
+    layouts = {}
+
+    def flush_fragment():
+        nonlocal frag_buf
+        if not frag_buf:
+            return
+        start = out.tell() - base
+        packed = zlib.compress(bytes(frag_buf), 6)
+        if len(packed) < len(frag_buf):
+            out.write(packed)
+            fragments.append((start, len(packed)))
+        else:
+            out.write(frag_buf)
+            fragments.append((start, len(frag_buf) | 1 << 24))
+        frag_buf = bytearray()
+
+    def chunks_of(node):
+        if node.chunks is not None:
+            yield from node.chunks()
+        else:
+            yield node.data
+
+    for node in order:
+        if not isinstance(node, File):
+            continue
+        start = out.tell() - base
+        sizes = []
+        pending = bytearray()
+        written = 0
+        tail = b""
+        for chunk in chunks_of(node):
+            pending += chunk
+            while len(pending) >= BLOCK_SIZE:
+                block = bytes(pending[:BLOCK_SIZE])
+                del pending[:BLOCK_SIZE]
+                packed = zlib.compress(block, 6) if node.compress else block
+                if node.compress and len(packed) < len(block):
+                    out.write(packed)
+                    sizes.append(len(packed))
+                else:
+                    out.write(block)
+                    sizes.append(len(block) | 1 << 24)
+                written += BLOCK_SIZE
+        tail = bytes(pending)
+        frag = (0xFFFFFFFF, 0)
+        if tail:
+            if len(frag_buf) + len(tail) > BLOCK_SIZE:
+                flush_fragment()
+            frag = (len(fragments), len(frag_buf))
+            frag_buf += tail
+        layouts[id(node)] = (start, sizes, frag, written + len(tail))
+    flush_fragment()
+
+    # Inode and directory tables
+    inodes = _Meta()
+    dirs = _Meta()
+    refs = {}
+    parent_of = {}
+    for node in order:
+        if isinstance(node, Dir):
+            for child in node.children.values():
+                parent_of[id(child)] = node
+
+    for node in order:
+        number = numbers[id(node)]
+        if isinstance(node, File):
+            start, sizes, (frag_index, frag_off), size = layouts[id(node)]
+            kind = 2
+            body = struct.pack("<IIII", start, frag_index, frag_off, size)
+            body += struct.pack(f"<{len(sizes)}I", *sizes)
+            mode = node.mode
+        elif isinstance(node, Symlink):
+            kind = 3
+            target = node.target.encode()
+            body = struct.pack("<II", 1, len(target)) + target
+            mode = node.mode
+        else:
+            kind = 1
+            listing_pos = dirs.pos()
+            names = sorted(node.children)
+            i = 0
+            listing = bytearray()
+            while i < len(names):
+                child = node.children[names[i]]
+                block_start, _ = refs[id(child)]
+                group = []
+                while i < len(names) and len(group) < 256:
+                    child = node.children[names[i]]
+                    if refs[id(child)][0] != block_start:
+                        break
+                    group.append(names[i])
+                    i += 1
+                base_number = numbers[id(node.children[group[0]])]
+                listing += struct.pack("<III", len(group) - 1, block_start, base_number)
+                for name in group:
+                    child = node.children[name]
+                    ctype = 1 if isinstance(child, Dir) else 3 if isinstance(child, Symlink) else 2
+                    encoded = name.encode()
+                    listing += struct.pack(
+                        "<HhHH", refs[id(child)][1], numbers[id(child)] - base_number, ctype, len(encoded) - 1
+                    ) + encoded
+            dirs.write(bytes(listing))
+            dir_block, dir_offset = dirs.ref(listing_pos)
+            parent = parent_of.get(id(node))
+            parent_number = numbers[id(parent)] if parent else len(order) + 1
+            body = struct.pack("<IIHHI", dir_block, 2 + len(node.children), len(listing) + 3, dir_offset,
+                               parent_number)
+            mode = node.mode
+        pos = inodes.pos()
+        inodes.write(struct.pack("<HHHHII", kind, mode, 0, 0, mtime, number) + body)
+        refs[id(node)] = inodes.ref(pos)
+
+    root_start, root_offset = refs[id(root)]
+    inode_bytes = inodes.finish()
+    dir_bytes = dirs.finish()
+
+    inode_table = out.tell() - base
+    out.write(inode_bytes)
+    directory_table = out.tell() - base
+    out.write(dir_bytes)
+
+    # Fragment table: metadata blocks of entries, then the u64 lookup table
+    frag_meta = []
+    for i in range(0, len(fragments), METADATA_SIZE // 16):
+        frag_meta.append(out.tell() - base)
+        entries = b"".join(struct.pack("<QII", s, z, 0) for s, z in fragments[i:i + METADATA_SIZE // 16])
+        out.write(struct.pack("<H", len(entries) | 0x8000) + entries)
+    fragment_table = out.tell() - base
+    out.write(b"".join(struct.pack("<Q", p) for p in frag_meta))
+
+    id_meta = out.tell() - base
+    out.write(struct.pack("<H", 4 | 0x8000) + struct.pack("<I", 0))
+    id_table = out.tell() - base
+    out.write(struct.pack("<Q", id_meta))
+
+    bytes_used = out.tell() - base
+    pad = (-bytes_used) % 4096
+    out.write(b"\0" * pad)
+    end = out.tell()
+
+    superblock = struct.pack(
+        "<4sIIIIHHHHHHQQQQQQQQ",
+        b"hsqs", len(order), mtime, BLOCK_SIZE, len(fragments), 1, BLOCK_LOG, 0x0200, 1, 4, 0,
+        (root_start << 16) | root_offset, bytes_used, id_table, 0xFFFFFFFFFFFFFFFF,
+        inode_table, directory_table, fragment_table, 0xFFFFFFFFFFFFFFFF,
+    )
+    out.seek(base)
+    out.write(superblock)
+    out.seek(end)
+
+
+def elf_stub():
+    """A 128-byte ELF64 header whose section headers end where SquashFS begins."""
+    ident = b"\x7fELF" + bytes([2, 1, 1, 0]) + b"AI\x02" + b"\0" * 5
+    header = ident + struct.pack("<HHIQQQIHHHHHH", 2, 62, 1, 0, 0, 64, 0, 64, 56, 0, 64, 1, 0)
+    return header + b"\0" * 64
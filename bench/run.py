@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+"""Offline end-to-end benchmark of check.py and update_pkgbuild.py.
+
+Generates synthetic AppImages (an ELF stub followed by a SquashFS image
+with ``product.json`` and a large incompressible payload), serves them
+together with fake Cursor API, AUR and GitHub endpoints from
+``bench/server.py``, and runs the real scripts against that server with a
+cold cache. For each size and step it records wall time, peak RSS and
+bytes read/written, checks that the PKGBUILD got the right checksum, and
+optionally compares the results with a saved baseline.
+
+Usage:
+  python bench/run.py [--sizes 50M,200M,1G] [--unified] [--local] [--output results.json]
+                      [--baseline results.json] [--threshold 0.10]
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from mksqfs import Dir, File, add, elf_stub, write_squashfs
+from server import Release, StandInServer
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+sys.path.insert(1, REPO)
+from pkgbuild import PKGBUILD  # noqa: E402
+CHILD = os.path.join(HERE, "_child.py")
+
+DEFAULT_SIZES = "50M,200M,1G"
+DEFAULT_THRESHOLD = 0.10
+# Wall time differences below this are noise, whatever the ratio
+MIN_WALL_DELTA = 0.25
+# Metrics compared against the baseline
+GATED = ("wall_seconds", "max_rss_bytes")
+
+VSCODE_VERSION = "1.99.3"
+ELECTRON_VERSION = "37.2.3"
+PAYLOAD_PATH = "usr/share/cursor/cursor"
+PRODUCT_JSON_PATH = "usr/share/cursor/resources/app/product.json"
+# Compiled-in user agent fragment the Electron resolver scans the binary for
+ELECTRON_MARKER = f"Chrome/138.0.7204.97 Electron/{ELECTRON_VERSION} Safari/537.36".encode()
+# Bump when the generated image changes so cached images get rebuilt
+GENERATOR_VERSION = 2
+
+_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    if text[-1] in _UNITS:
+        return int(float(text[:-1]) * _UNITS[text[-1]])
+    return int(text)
+
+
+def generate_appimage(path, size):
+    """Write a ``size``-byte-ish AppImage to ``path`` and return its SHA-512."""
+    block = os.urandom(1024 * 1024)
+    marker_at = size // 3
+
+    def payload():
+        position = 0
+        while position < size:
+            chunk = block[:size - position]
+            if position <= marker_at < position + len(chunk):
+                at = marker_at - position
+                chunk = chunk[:at] + ELECTRON_MARKER + chunk[at + len(ELECTRON_MARKER):]
+                chunk = chunk[:size - position]
+            position += len(chunk)
+            yield chunk
+
+    root = Dir()
+    product = {"nameShort": "Cursor", "version": "2.99.0", "vscodeVersion": VSCODE_VERSION}
+    add(root, PRODUCT_JSON_PATH, File(json.dumps(product, indent=2).encode()))
+    add(root, "usr/share/cursor/resources/app/package.json", File(b'{"name": "cursor", "main": "./out/main.js"}'))
+    add(root, "co.anysphere.cursor.png", File(b"\x89PNG\r\n\x1a\n" + bytes(4096)))
+    # Random data does not compress, so store it raw instead of burning CPU on zlib
+    add(root, PAYLOAD_PATH, File(size=size, chunks=payload, mode=0o755, compress=False))
+
+    with open(path, "wb") as out:
+        out.write(elf_stub())
+        write_squashfs(out, root)
+
+    sha512 = hashlib.sha512()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            sha512.update(chunk)
+    return sha512.hexdigest()
+
+
+def ensure_appimage(image_dir, size):
+    """Return (path, sha512) of the generated AppImage for ``size``, reusing an earlier one."""
+    path = os.path.join(image_dir, f"bench-{size}.AppImage")
+    meta_path = path + ".json"
+    if os.path.exists(path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if meta.get("size") == os.path.getsize(path) and meta.get("generator") == GENERATOR_VERSION:
+            return path, meta["sha512"]
+    print(f"Generating {size} byte AppImage in {path}")
+    sha512 = generate_appimage(path, size)
+    with open(meta_path, "w") as f:
+        json.dump({"size": os.path.getsize(path), "sha512": sha512, "generator": GENERATOR_VERSION}, f)
+    return path, sha512
+
+
+def run_step(name, args, cwd, env):
+    """Run one updater script under _child.py; return its measurements."""
+    stats_path = os.path.join(cwd, f".{name}-stats.json")
+    start = time.monotonic()
+    result = subprocess.run(
+        [sys.executable, CHILD, stats_path] + args, cwd=cwd, env=env, capture_output=True, text=True
+    )
+    wall = time.monotonic() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{name} failed with exit code {result.returncode}:\n{result.stdout}{result.stderr}")
+    with open(stats_path) as f:
+        stats = json.load(f)
+    stats["wall_seconds"] = wall
+    return stats
+
+
+def bench_size(size, image_dir, connections, unified=False, local=False):
+    appimage, sha512 = ensure_appimage(image_dir, size)
+    commit = hashlib.sha1(f"bench-{size}".encode()).hexdigest()
+    with open(os.path.join(REPO, "PKGBUILD")) as f:
+        pkgbuild = f.read()
+
+    release = Release(commit, "2.99.0", appimage, VSCODE_VERSION, ELECTRON_VERSION, pkgbuild)
+    server = StandInServer(release).start()
+    work_dir = tempfile.mkdtemp(prefix="cursor-bench-")
+    try:
+        # The PKGBUILD ships squashfs.py as a local source, whose checksum gets refreshed
+        for name in ("PKGBUILD", "squashfs.py"):
+            shutil.copy(os.path.join(REPO, name), work_dir)
+        env = dict(os.environ)
+        env.update(server.env())
+        env.update(
+            CURSOR_UPDATER_CACHE_DIR=os.path.join(work_dir, "cache"),
+            METRICS_REPORT=os.path.join(work_dir, "metrics.json"),
+            DOWNLOAD_CONNECTIONS=str(connections),
+            DEBUG="false",
+        )
+        env.pop("METRICS_TEXTFILE", None)
+        env.pop("SRCDEST", None)
+        if local:
+            # Re-packaging the pinned commit (a pkgrel bump) on a build host that already
+            # has the release in its source directory, so its checksum is known
+            pinned = PKGBUILD.load(os.path.join(work_dir, "PKGBUILD"))
+            pinned.set("pkgver", release.version)
+            pinned.set("_commit", commit)
+            pinned.set_item("sha512sums", 0, sha512)
+            pinned.save(os.path.join(work_dir, "PKGBUILD"))
+            srcdest = os.path.join(work_dir, "srcdest")
+            os.makedirs(srcdest)
+            os.link(appimage, os.path.join(srcdest, f"Cursor-{release.version}-x86_64.AppImage"))
+            env["APPIMAGE_SEARCH_DIRS"] = srcdest
+        else:
+            env.pop("APPIMAGE_SEARCH_DIRS", None)
+
+        if unified:
+            steps = {"run": run_step("run", [os.path.join(REPO, "updater.py"), "run"], work_dir, env)}
+        else:
+            steps = {
+                "check": run_step("check", [os.path.join(REPO, "check.py")], work_dir, env),
+                "update": run_step(
+                    "update", [os.path.join(REPO, "update_pkgbuild.py"), "check_output.json"], work_dir, env
+                ),
+            }
+
+        with open(os.path.join(work_dir, "PKGBUILD")) as f:
+            updated = f.read()
+        if sha512 not in updated or commit not in updated:
+            raise RuntimeError("PKGBUILD was not updated with the served AppImage's checksum and commit")
+
+        with open(os.path.join(work_dir, "metrics.json")) as f:
+            report = json.load(f)
+        phases = {}
+        for entry in report["spans"]:
+            phases[entry["name"]] = phases.get(entry["name"], 0) + entry["duration_seconds"]
+        result = {
+            "appimage_bytes": os.path.getsize(appimage),
+            "served_bytes": server.bytes_served,
+            "requests": server.requests,
+            "steps": steps,
+            "phases": phases,
+        }
+        if "profile" in report:
+            # Present when run with METRICS_PROFILE=true
+            result["profile"] = report["profile"]
+        return result
+    finally:
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def compare(results, baseline, threshold):
+    """Return a list of human-readable regressions of ``results`` against ``baseline``."""
+    regressions = []
+    for label, current in results["sizes"].items():
+        previous = baseline.get("sizes", {}).get(label)
+        if not previous:
+            continue
+        for step, stats in current["steps"].items():
+            old_stats = previous["steps"].get(step, {})
+            for metric in GATED:
+                old, new = old_stats.get(metric), stats.get(metric)
+                if not old or new is None:
+                    continue
+                if metric == "wall_seconds" and new - old < MIN_WALL_DELTA:
+                    continue
+                if new > old * (1 + threshold):
+                    change = (new / old - 1) * 100
+                    regressions.append(f"{label} {step} {metric}: {old:.6g} -> {new:.6g} (+{change:.1f}%)")
+    return regressions
+
+
+def print_table(results):
+    print(f"{'size':>6} {'step':>7} {'wall s':>8} {'peak RSS MiB':>13} {'rchar MiB':>9} {'wchar MiB':>9}")
+    for label, entry in results["sizes"].items():
+        for step, stats in entry["steps"].items():
+            print(
+                f"{label:>6} {step:>7} {stats['wall_seconds']:8.2f} {stats['max_rss_bytes'] / 2 ** 20:13.1f}"
+                f" {(stats['rchar'] or 0) / 2 ** 20:9.1f} {(stats['wchar'] or 0) / 2 ** 20:9.1f}"
+            )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the updater against a local stand-in server")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated AppImage sizes (e.g. 50M,1G)")
+    parser.add_argument("--image-dir", default=os.path.join(tempfile.gettempdir(), "cursor-updater-bench"),
+                        help="where generated AppImages are kept between runs")
+    parser.add_argument("--connections", type=int, default=1, help="DOWNLOAD_CONNECTIONS for update_pkgbuild.py")
+    parser.add_argument("--unified", action="store_true", help="benchmark 'updater.py run' as a single step")
+    parser.add_argument("--local", action="store_true",
+                        help="re-package the pinned commit with its AppImage in APPIMAGE_SEARCH_DIRS")
+    parser.add_argument("--output", help="write results as JSON (usable as a later --baseline)")
+    parser.add_argument("--baseline", help="fail if results regress against this earlier --output")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed relative regression (default 0.10 = 10%%)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.image_dir, exist_ok=True)
+    results = {"connections": args.connections, "python": sys.version.split()[0], "sizes": {}}
+    for label in args.sizes.split(","):
+        label = label.strip()
+        print(f"Benchmarking {label}...")
+        results["sizes"][label] = bench_size(
+            parse_size(label), args.image_dir, args.connections, args.unified, args.local
+        )
+
+    print_table(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("connections") != args.connections:
+            print(f"Note: baseline used {baseline.get('connections')} connections, this run {args.connections}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"Regressions beyond {args.threshold * 100:.0f}%:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions beyond {args.threshold * 100:.0f}% against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
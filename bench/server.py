@@ -0,0 +1,203 @@
+"""Local stand-in for the Cursor API, AUR RPC and cgit, GitHub raw and downloads.cursor.com.
+
+One threaded HTTP server answers every endpoint the updater talks to, so
+the real scripts can run unmodified with only their base URLs pointed
+here (``CURSOR_API_URL``, ``AUR_URL``, ``VSCODE_RAW_URL``,
+``CURSOR_DOWNLOADS_URL``). AppImages are served from disk with
+``Accept-Ranges``/``Range`` support, like the real CDN.
+"""
+import json
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+_LOCKFILE = re.compile(r"^/microsoft/vscode/refs/tags/([^/]+)/package-lock\.json$")
+_APPIMAGE = re.compile(r"^/production/([0-9a-f]+)/linux/x64/Cursor-([^/]+)-x86_64\.AppImage$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+_ASSIGNMENT = re.compile(r"^(pkgver|pkgrel)=['\"]?([^'\"\s]+)", re.MULTILINE)
+
+COPY_CHUNK = 1024 * 1024
+
+
+def lockfile_json(electron_version):
+    """A package-lock.json shaped like VS Code's, pinning ``electron_version``."""
+    return json.dumps({
+        "name": "code-oss-dev",
+        "lockfileVersion": 3,
+        "packages": {
+            "": {"name": "code-oss-dev", "devDependencies": {"electron": electron_version}},
+            "node_modules/electron": {"version": electron_version, "dev": True},
+        },
+    }, indent=2).encode()
+
+
+class Release:
+    """What the stand-in currently publishes."""
+
+    def __init__(self, commit, version, appimage_path, vscode_version, electron_version, aur_pkgbuild):
+        self.commit = commit
+        self.version = version
+        self.appimage_path = appimage_path
+        self.vscode_version = vscode_version
+        self.electron_version = electron_version
+        self.aur_pkgbuild = aur_pkgbuild
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=b"", content_type="application/octet-stream", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        release = self.server.release
+        url = urlsplit(self.path)
+        self.server.count(url.path)
+
+        if url.path == "/api/download":
+            body = json.dumps({
+                "downloadUrl": f"{self.server.base_url}/production/{release.commit}/linux/x64/"
+                               f"Cursor-{release.version}-x86_64.AppImage",
+                "version": release.version,
+                "commitSha": release.commit,
+            }).encode()
+            etag = f'"{release.commit}"'
+            if self.headers.get("If-None-Match") == etag:
+                return self._send(304, headers={"ETag": etag})
+            return self._send(200, body, "application/json", {"ETag": etag})
+
+        if url.path == "/rpc/v5/info":
+            fields = dict(_ASSIGNMENT.findall(release.aur_pkgbuild))
+            results = [
+                {"Name": name, "PackageBase": name, "Version": f"{fields['pkgver']}-{fields['pkgrel']}"}
+                for name in parse_qs(url.query).get("arg[]", []) if name == self.server.pkgname
+            ]
+            body = json.dumps({"version": 5, "type": "multiinfo", "resultcount": len(results), "results": results})
+            return self._send(200, body.encode(), "application/json")
+
+        if url.path == "/cgit/aur.git/plain/PKGBUILD":
+            if parse_qs(url.query).get("h") != [self.server.pkgname]:
+                return self._send(404)
+            return self._send(200, release.aur_pkgbuild.encode(), "text/plain")
+
+        match = _LOCKFILE.match(url.path)
+        if match:
+            if match.group(1) != release.vscode_version:
+                return self._send(404)
+            return self._send(200, lockfile_json(release.electron_version), "text/plain")
+
+        match = _APPIMAGE.match(url.path)
+        if match and match.groups() == (release.commit, release.version):
+            return self._send_file(release.appimage_path)
+
+        self._send(404)
+
+    def _send_file(self, path):
+        total = os.path.getsize(path)
+        start, end = 0, total - 1
+        status = 200
+        requested = _RANGE.match(self.headers.get("Range", ""))
+        if requested:
+            first, last = requested.groups()
+            if first:
+                start = int(first)
+                end = min(int(last), total - 1) if last else total - 1
+            else:
+                start = max(0, total - int(last))
+            if start > end:
+                return self._send(416, headers={"Content-Range": f"bytes */{total}"})
+            status = 206
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{total}")
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining:
+                chunk = f.read(min(COPY_CHUNK, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+        self.server.served(end - start + 1)
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, release, pkgname="cursor-beta-bin", host="127.0.0.1", port=0):
+        super().__init__((host, port), _Handler)
+        self.release = release
+        self.pkgname = pkgname
+        self.base_url = f"http://{host}:{self.server_address[1]}"
+        self.requests = {}
+        self.bytes_served = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def count(self, path):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def served(self, count):
+        with self._lock:
+            self.bytes_served += count
+
+    def env(self):
+        """Environment variables pointing the updater at this server."""
+        return {
+            "CURSOR_API_URL": f"{self.base_url}/api/download",
+            "AUR_URL": self.base_url,
+            "VSCODE_RAW_URL": f"{self.base_url}/microsoft/vscode",
+            "CURSOR_DOWNLOADS_URL": self.base_url,
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python bench/server.py <AppImage>")
+        sys.exit(1)
+    here = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(here, "..", "PKGBUILD")) as f:
+        pkgbuild = f.read()
+    server = StandInServer(
+        Release("0" * 40, "9.9.9", sys.argv[1], "1.99.0", "37.2.3", pkgbuild), port=8765
+    )
+    for name, value in server.env().items():
+        print(f"export {name}={value}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
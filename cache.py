@@ -0,0 +1,87 @@
+"""Persistent JSON caches shared between updater runs.
+
+Everything lives under ``$CURSOR_UPDATER_CACHE_DIR`` (default
+``$XDG_CACHE_HOME/aur-cursor-beta-bin-updater``). Files are replaced
+atomically so an interrupted run never leaves a truncated cache behind,
+and a missing or corrupt file simply reads as empty.
+"""
+import json
+import os
+import tempfile
+import time
+
+CACHE_DIR = os.environ.get("CURSOR_UPDATER_CACHE_DIR") or os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "aur-cursor-beta-bin-updater"
+)
+
+# Eviction policy for per-commit artifact metadata
+ARTIFACT_CACHE_MAX_ENTRIES = int(os.environ.get("ARTIFACT_CACHE_MAX_ENTRIES", "200"))
+ARTIFACT_CACHE_MAX_AGE_DAYS = int(os.environ.get("ARTIFACT_CACHE_MAX_AGE_DAYS", "90"))
+
+ARTIFACTS_FILE = "artifacts.json"
+
+
+def cache_path(name):
+    return os.path.join(CACHE_DIR, name)
+
+
+def load_json(name):
+    """Load a cache file, returning an empty dict if it is missing or unreadable."""
+    try:
+        with open(cache_path(name), "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def store_json(name, data):
+    """Atomically replace a cache file with ``data``."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=CACHE_DIR, prefix=f".{name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, cache_path(name))
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def evict(entries, max_entries, max_age_days, now=None):
+    """Drop entries older than ``max_age_days`` and keep at most ``max_entries`` newest."""
+    now = time.time() if now is None else now
+    cutoff = now - max_age_days * 86400
+    fresh = {key: entry for key, entry in entries.items() if entry.get("stored_at", 0) >= cutoff}
+    newest = sorted(fresh, key=lambda key: fresh[key].get("stored_at", 0), reverse=True)[:max_entries]
+    return {key: fresh[key] for key in newest}
+
+
+def _artifact_key(commit, version):
+    return f"{commit}:{version}"
+
+
+def get_artifact(commit, version):
+    """Return cached metadata for the AppImage of ``commit``/``version``, if any."""
+    entry = load_json(ARTIFACTS_FILE).get(_artifact_key(commit, version))
+    if entry and entry.get("stored_at", 0) >= time.time() - ARTIFACT_CACHE_MAX_AGE_DAYS * 86400:
+        return entry
+    return None
+
+
+def put_artifact(commit, version, sha512, size, vscode_version, electron_version):
+    """Record the metadata of a processed AppImage."""
+    entries = load_json(ARTIFACTS_FILE)
+    entries[_artifact_key(commit, version)] = {
+        "commit": commit,
+        "version": version,
+        "sha512": sha512,
+        "size": size,
+        "vscode_version": vscode_version,
+        "electron_version": electron_version,
+        "stored_at": time.time(),
+    }
+    store_json(ARTIFACTS_FILE, evict(entries, ARTIFACT_CACHE_MAX_ENTRIES, ARTIFACT_CACHE_MAX_AGE_DAYS))
@@ -1,27 +1,46 @@
 #!/usr/bin/env python
 import requests
-import re
 import sys
 import os
 import json
 import time
-from packaging import version
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 
+import aur
+import metrics
+from aur import AURUnavailableError
+from http_state import conditional_get, remember
+from net import TIMEOUT, backoff_delay, get_session
+from pkgbuild import PKGBUILD, PKGBUILDError
 
-def get_latest_commit_and_version():
+DEFAULT_PLATFORM = "linux-x64"
+DEFAULT_RELEASE_TRACK = "latest"
+DEFAULT_PKGNAME = "cursor-beta-bin"
+
+# Endpoints, overridable to point the updater at a mirror or a local stand-in
+CURSOR_API_URL = os.environ.get("CURSOR_API_URL", "https://cursor.com/api/download")
+
+# Upper bound on concurrent requests in batch mode (matches the session pool size)
+BATCH_WORKERS = 16
+
+
+@metrics.timed("cursor_api")
+def get_latest_commit_and_version(
+    session, platform=DEFAULT_PLATFORM, release_track=DEFAULT_RELEASE_TRACK, max_retries=2
+):
     """Get the latest commit hash and version from Cursor's API."""
-    cursor_url = "https://cursor.com/api/download?platform=linux-x64&releaseTrack=latest"
-    headers = {
-        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36"
-        " (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36",
-    }
+    cursor_url = f"{CURSOR_API_URL}?platform={platform}&releaseTrack={release_track}"
 
-    max_retries = 2
     for attempt in range(max_retries + 1):
         try:
             print("::debug::Making request to:", cursor_url)
-            response = requests.get(cursor_url, headers=headers)
+            response, cached = conditional_get(cursor_url, session, timeout=TIMEOUT)
             print(f"::debug::API status code: {response.status_code}")
+            if cached is not None:
+                commit, version, download_url = cached
+                print(f"::debug::Cursor API unchanged, cached version: {version}, commit: {commit}")
+                return commit, version, download_url
             print(f"::debug::API raw response: {response.text}")
 
             if response.status_code == 200 and response.text.strip():
@@ -34,6 +53,7 @@ def get_latest_commit_and_version():
                 commit = data["commitSha"]
 
                 print(f"::debug::Extracted version: {version}, commit: {commit}")
+                remember(cursor_url, response, [commit, version, download_url])
                 return commit, version, download_url
 
             else:
@@ -48,74 +68,83 @@ def get_latest_commit_and_version():
             print(f"::warning::{str(e)}")
 
         if attempt < max_retries:
-            print("::debug::Retrying in 5 seconds...")
-            time.sleep(5)
+            metrics.retry()
+            delay = backoff_delay(attempt)
+            print(f"::debug::Retrying in {delay:.1f} seconds...")
+            time.sleep(delay)
 
     print("::error::Failed to get download link after all retry attempts")
     return None, None, None
 
 
-def get_local_pkgbuild_info():
-    with open("PKGBUILD", "r") as file:
-        content = file.read()
-    version_match = re.search(r"pkgver=([^\n]+)", content)
-    rel_match = re.search(r"pkgrel=(\d+)", content)
-    commit_match = re.search(r"_commit=([a-f0-9]+)", content)
-    if version_match and rel_match and commit_match:
-        return version_match.group(1).strip(), rel_match.group(1), commit_match.group(1)
-    else:
-        print("::error::Unable to find current version, release, or commit in local PKGBUILD")
+def parse_pkgbuild_info(content):
+    """Return (pkgver, pkgrel, _commit) from PKGBUILD text, or Nones if any is missing."""
+    try:
+        pkgbuild = PKGBUILD.parse(content)
+    except PKGBUILDError as e:
+        print(f"::warning::Failed to parse PKGBUILD: {str(e)}")
         return None, None, None
+    return pkgbuild_info(pkgbuild)
 
 
-def check_aur_availability():
-    """Fast fail check for AUR availability."""
-    url = "https://aur.archlinux.org"
-    try:
-        # Quick connectivity check with short timeout
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        return True
-    except (requests.exceptions.RequestException, requests.exceptions.Timeout) as e:
-        print(f"::error::AUR is not available: {str(e)}")
-        print("::error::Fast failing due to AUR unavailability (network down, server down, or maintenance)")
-        return False
+def pkgbuild_info(pkgbuild):
+    """Return (pkgver, pkgrel, _commit) of a parsed PKGBUILD, or Nones if any is missing."""
+    info = pkgbuild.get("pkgver"), pkgbuild.get("pkgrel"), pkgbuild.get("_commit")
+    return info if all(info) else (None, None, None)
 
 
-def get_aur_pkgbuild_info():
-    """Get AUR PKGBUILD info with fast fail if AUR is unavailable."""
-    # Fast fail check first
-    if not check_aur_availability():
-        print("::error::Aborting AUR operations due to unavailability")
-        sys.exit(1)
-    
-    url = "https://aur.archlinux.org/cgit/aur.git/plain/PKGBUILD?h=cursor-beta-bin"
+def get_local_pkgbuild_info(path="PKGBUILD"):
+    with open(path, "r") as file:
+        info = parse_pkgbuild_info(file.read())
+    if None in info:
+        print("::error::Unable to find current version, release, or commit in local PKGBUILD")
+    return info
+
+
+@metrics.timed("aur")
+def get_aur_pkgbuild_info(session, pkgname=DEFAULT_PKGNAME, versions=None, commit_versions=()):
+    """Get (pkgver, pkgrel, _commit) of an AUR package, failing fast if AUR is unavailable.
+
+    pkgver and pkgrel come from the AUR RPC, or from ``versions`` as
+    returned by an earlier batched :func:`aur.get_versions`. ``_commit`` is
+    only read from the PKGBUILD when pkgver is one of ``commit_versions``:
+    a different version cannot be the same commit, so then it is None.
+    """
     try:
-        response = requests.get(url, timeout=30)
-        
-        # Handle 404 specifically - return None like old behavior
-        if response.status_code == 404:
-            print("::warning::AUR PKGBUILD not found (404)")
+        if versions is None:
+            versions = aur.get_versions(session, [pkgname])
+        pkgver, pkgrel = versions[pkgname]
+        if pkgver is None:
+            print(f"::warning::{pkgname} not found in AUR")
             return None, None, None
-        
-        response.raise_for_status()
-        content = response.text
-        version_match = re.search(r"pkgver=([^\n]+)", content)
-        rel_match = re.search(r"pkgrel=(\d+)", content)
-        commit_match = re.search(r"_commit=([a-f0-9]+)", content)
-        if version_match and rel_match and commit_match:
-            return version_match.group(1).strip(), rel_match.group(1), commit_match.group(1)
-        else:
-            print("::warning::Unable to find version, release, or commit in AUR PKGBUILD")
+        if pkgver not in commit_versions:
+            print(f"::debug::AUR has version {pkgver}, its commit is not needed yet")
+            return pkgver, pkgrel, None
+
+        commit = aur.get_commit(session, pkgname)
+        if not commit:
+            print("::warning::Unable to find commit in AUR PKGBUILD")
             return None, None, None
-    except (requests.exceptions.RequestException, requests.exceptions.Timeout) as e:
-        print(f"::error::Error fetching AUR PKGBUILD: {str(e)}")
-        print("::error::Fast failing due to AUR request failure")
-        sys.exit(1)
+        return pkgver, pkgrel, commit
+    except AURUnavailableError as e:
+        print(f"::error::AUR is not available: {str(e)}")
+        print("::error::Fast failing due to AUR unavailability (network down, server down, or maintenance)")
+        raise
+
+
+def complete_aur_info(session, aur_info, latest_version, pkgname=DEFAULT_PKGNAME):
+    """Fetch the AUR commit skipped by :func:`get_aur_pkgbuild_info` if AUR is at ``latest_version``."""
+    aur_version, aur_rel, aur_commit = aur_info
+    if aur_commit or aur_version is None or aur_version != latest_version:
+        return aur_info
+    return get_aur_pkgbuild_info(session, pkgname, {pkgname: (aur_version, aur_rel)}, (aur_version,))
 
 
 def compare_versions(version1, version2):
     """Compare two version strings and return True if version1 is higher than version2."""
+    # Only needed with VERSION_PROTECTION, so don't pay for the import otherwise
+    from packaging import version
+
     try:
         return version.parse(version1) > version.parse(version2)
     except version.InvalidVersion:
@@ -123,35 +152,56 @@ def compare_versions(version1, version2):
         return False
 
 
-try:
-    # Check if DEBUG is set to true
-    debug_mode = os.environ.get("DEBUG", "").lower() == "true"
+@metrics.timed("probe")
+def probe_release_metadata(session, commit, release_version):
+    """Read vscodeVersion of a release via HTTP range requests and resolve its electron."""
+    from electron import get_electron_version
+    from probe import probe_product_json
+    from update_pkgbuild import appimage_url
 
+    try:
+        product_data = probe_product_json(appimage_url(commit, release_version), session)
+    except Exception as e:
+        print(f"::warning::Failed to probe release metadata: {str(e)}")
+        return None, None
+    vscode_version = product_data.get("vscodeVersion")
+    print(f"::debug::Probed VSCode version: {vscode_version}")
+    if not vscode_version:
+        return None, None
+    electron_version = get_electron_version(vscode_version, session)
+    print(f"::debug::Probed Electron version: {electron_version}")
+    return vscode_version, electron_version
+
+
+def read_flags():
+    """Read the update-detection switches from the environment."""
     # Check if version comparison protection is enabled (default: false)
     version_protection = os.environ.get("VERSION_PROTECTION", "").lower() == "true"
 
     # Check if commit-based update detection is enabled (default: true)
     commit_based_updates = os.environ.get("COMMIT_BASED_UPDATES", "true").lower() == "true"
 
-    # Get the latest commit, version, and download URL
-    latest_commit, latest_version, download_url = get_latest_commit_and_version()
-    if not latest_commit or not latest_version:
-        raise ValueError("Failed to get latest commit and version after retries")
+    # Check if the new release's product.json should be probed via range requests (default: false)
+    probe_metadata = os.environ.get("PROBE_METADATA", "").lower() == "true"
 
-    print(f"::debug::Latest commit: {latest_commit}")
-    print(f"::debug::Latest version: {latest_version}")
-    print(f"::debug::Download URL: {download_url}")
+    return version_protection, commit_based_updates, probe_metadata
 
-    local_version, local_rel, local_commit = get_local_pkgbuild_info()
-    if local_version is None or local_rel is None or local_commit is None:
-        raise ValueError("Failed to get local version, release, or commit")
+
+def determine_update(latest, local, aur, download_url, commit_based_updates, version_protection):
+    """Decide whether an update is needed and return the check output dict.
+
+    ``local`` and ``aur`` are (version, rel, commit) tuples and ``latest``
+    is (commit, version) as returned by the Cursor API.
+    """
+    latest_commit, latest_version = latest
+    local_version, local_rel, local_commit = local
+    aur_version, aur_rel, aur_commit = aur
 
     print(f"::debug::Local version: {local_version}, release: {local_rel}, commit: {local_commit}")
     print(f"::debug::Version protection enabled: {version_protection}")
     print(f"::debug::Commit-based updates enabled: {commit_based_updates}")
 
     # Determine if update is needed
-    aur_version, aur_rel, aur_commit = get_aur_pkgbuild_info()
     print(f"::debug::AUR version: {aur_version}, release: {aur_rel}, commit: {aur_commit}")
 
     # Check if this is a manual release update
@@ -225,8 +275,7 @@ try:
 
     print(f"::debug::New version: {new_version}, new release: {new_rel}, new commit: {new_commit}")
 
-    # Create output as JSON
-    output = {
+    return {
         "update_needed": update_needed,
         "local_version": local_version,
         "local_rel": local_rel,
@@ -242,13 +291,192 @@ try:
         "aur_commit": aur_commit,
     }
 
-    # Write JSON to file
-    with open("check_output.json", "w") as f:
+
+@metrics.timed("check")
+def run_check(session=None, pkgbuild=None, platform=DEFAULT_PLATFORM, release_track=DEFAULT_RELEASE_TRACK):
+    """Run one single-target check and return its output dict.
+
+    ``pkgbuild`` is an already parsed local PKGBUILD, whose ``pkgname``
+    is the AUR package compared against; if omitted, ``PKGBUILD`` in the
+    current directory is read and compared with ``cursor-beta-bin``.
+    ``platform`` and ``release_track`` select the Cursor release to
+    compare against.
+    """
+    version_protection, commit_based_updates, probe_metadata = read_flags()
+
+    if pkgbuild is None:
+        local_info = get_local_pkgbuild_info()
+        pkgname = DEFAULT_PKGNAME
+    else:
+        local_info = pkgbuild_info(pkgbuild)
+        pkgname = pkgbuild.get("pkgname") or DEFAULT_PKGNAME
+    if None in local_info:
+        raise ValueError("Failed to get local version, release, or commit")
+
+    # Query the Cursor API and the AUR concurrently over one pooled session. The AUR
+    # commit is fetched right away if AUR has the local version, which is the usual case
+    session = session or get_session()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        latest_future = executor.submit(get_latest_commit_and_version, session, platform, release_track)
+        aur_future = executor.submit(get_aur_pkgbuild_info, session, pkgname, None, (local_info[0],))
+        aur_info = aur_future.result()
+        latest_commit, latest_version, download_url = latest_future.result()
+
+    if not latest_commit or not latest_version:
+        raise ValueError("Failed to get latest commit and version after retries")
+
+    print(f"::debug::Latest commit: {latest_commit}")
+    print(f"::debug::Latest version: {latest_version}")
+    print(f"::debug::Download URL: {download_url}")
+
+    aur_info = complete_aur_info(session, aur_info, latest_version, pkgname)
+
+    output = determine_update(
+        (latest_commit, latest_version), local_info, aur_info, download_url, commit_based_updates, version_protection
+    )
+
+    if output["update_needed"]:
+        metrics.mark_release_detected(output["new_commit"])
+    metrics.gauge("update_needed", int(bool(output["update_needed"])))
+
+    if output["update_needed"] and probe_metadata:
+        vscode_version, electron_version = probe_release_metadata(session, output["new_commit"], output["new_version"])
+        output["vscode_version"] = vscode_version
+        output["electron_version"] = electron_version
+
+    return output
+
+
+def write_check_output(output, path="check_output.json"):
+    with open(path, "w") as f:
         json.dump(output, f)
+    print(f"::debug::Check output written to {path}")
+
 
-    print("::debug::Check output written to check_output.json")
-    print(f"::debug::Final new_version: {new_version}, new_rel: {new_rel}, new_commit: {new_commit}")
+def main():
+    output = run_check()
 
-except Exception as e:
-    print(f"::error::Error in main execution: {str(e)}")
-    sys.exit(1)
+    # Write JSON to file
+    write_check_output(output)
+    print(
+        f"::debug::Final new_version: {output['new_version']}, new_rel: {output['new_rel']}, "
+        f"new_commit: {output['new_commit']}"
+    )
+
+
+def run_batch(config_path, output_path="batch_output.json"):
+    """Check every target listed in ``config_path`` and write one combined output.
+
+    Identical Cursor API queries (same platform and release track) are
+    made only once and run concurrently over the shared session, next to a
+    single AUR RPC request for all package names.
+    """
+    with open(config_path, "r") as f:
+        targets = json.load(f)["targets"]
+    config_dir = os.path.dirname(os.path.abspath(config_path))
+    version_protection, commit_based_updates, _ = read_flags()
+
+    def upstream_key(target):
+        return target.get("platform", DEFAULT_PLATFORM), target.get("release_track", DEFAULT_RELEASE_TRACK)
+
+    def pkgbuild_path(target):
+        return os.path.join(config_dir, target.get("pkgbuild", "PKGBUILD"))
+
+    upstream_keys = sorted({upstream_key(target) for target in targets})
+    pkgnames = sorted({target["pkgname"] for target in targets})
+    print(
+        f"::debug::Batch of {len(targets)} targets: {len(upstream_keys)} Cursor API queries,"
+        f" {len(pkgnames)} AUR packages"
+    )
+
+    session = get_session()
+    workers = max(1, min(BATCH_WORKERS, len(upstream_keys) + 1))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # One AUR RPC request covers every package name
+        versions_future = executor.submit(aur.get_versions, session, pkgnames)
+        upstream_futures = {
+            key: executor.submit(get_latest_commit_and_version, session, *key) for key in upstream_keys
+        }
+        aur_versions = versions_future.result()
+        upstream = {key: future.result() for key, future in upstream_futures.items()}
+
+    local_infos = {}
+    for path in {pkgbuild_path(target) for target in targets}:
+        try:
+            local_infos[path] = get_local_pkgbuild_info(path)
+        except OSError as e:
+            local_infos[path] = (None, None, None)
+            print(f"::error::Cannot read {path}: {str(e)}")
+
+    # AUR commits are only needed for packages whose AUR version is a local or latest one
+    commit_versions = {name: set() for name in pkgnames}
+    for target in targets:
+        commit_versions[target["pkgname"]].update(
+            (upstream[upstream_key(target)][1], local_infos[pkgbuild_path(target)][0])
+        )
+    with ThreadPoolExecutor(max_workers=max(1, min(BATCH_WORKERS, len(pkgnames)))) as executor:
+        aur_futures = {
+            name: executor.submit(get_aur_pkgbuild_info, session, name, aur_versions, commit_versions[name])
+            for name in pkgnames
+        }
+        aur_info = {name: future.result() for name, future in aur_futures.items()}
+
+    results = {}
+    for target in targets:
+        name = target.get("name", target["pkgname"])
+        platform, release_track = upstream_key(target)
+        print(f"::debug::Target {name}: {target['pkgname']} ({platform}, {release_track})")
+        section = {"pkgname": target["pkgname"], "platform": platform, "release_track": release_track}
+        results[name] = section
+
+        latest_commit, latest_version, download_url = upstream[(platform, release_track)]
+        if not latest_commit or not latest_version:
+            section.update(update_needed=False, error="Failed to get latest commit and version after retries")
+            continue
+
+        local_info = local_infos[pkgbuild_path(target)]
+        if None in local_info:
+            section.update(update_needed=False, error="Failed to get local version, release, or commit")
+            continue
+
+        section.update(
+            determine_update(
+                (latest_commit, latest_version),
+                local_info,
+                aur_info[target["pkgname"]],
+                download_url,
+                commit_based_updates,
+                version_protection,
+            )
+        )
+        if section["update_needed"]:
+            metrics.mark_release_detected(section["new_commit"])
+
+    combined = {
+        "update_needed": any(bool(section["update_needed"]) for section in results.values()),
+        "targets": results,
+    }
+    with open(output_path, "w") as f:
+        json.dump(combined, f, indent=2)
+
+    updated = [name for name, section in results.items() if section["update_needed"]]
+    print(f"::debug::Batch output written to {output_path}; updates needed for: {updated or 'none'}")
+    return combined
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check for new Cursor releases against AUR")
+    parser.add_argument("--batch", metavar="CONFIG", help="check every target listed in a JSON config file")
+    parser.add_argument("--output", default="batch_output.json", help="combined output file for --batch")
+    args = parser.parse_args()
+
+    try:
+        if args.batch:
+            run_batch(args.batch, args.output)
+        else:
+            main()
+    except Exception as e:
+        print(f"::error::Error in main execution: {str(e)}")
+        sys.exit(1)
+    finally:
+        metrics.emit()
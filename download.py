@@ -0,0 +1,487 @@
+"""Streaming AppImage download with overlapped hashing and disk writes.
+
+The network reader fills buffers taken from a small fixed pool, a hasher
+thread feeds them to SHA-512 and a writer thread puts them on disk before
+handing them back to the pool, so peak memory stays at
+``POOL_SIZE * CHUNK_SIZE`` no matter how large the artifact is.
+
+When more than one connection is requested and the server advertises
+``Accept-Ranges: bytes``, the file is instead split into segments fetched
+in parallel with HTTP Range requests and written at their offsets into a
+preallocated file, while the hasher follows the contiguous written prefix.
+
+Dropped connections are resumed with ``Range: bytes=N-`` instead of
+starting over. A single-stream download keeps its data in a ``.part``
+file next to the destination, so even a later run can pick it up; the
+bytes already on disk are rehashed and the hash continues over the rest.
+"""
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+
+import requests
+import urllib3
+
+import metrics
+from net import backoff_delay, get_session
+
+CHUNK_SIZE = 1024 * 1024
+POOL_SIZE = 4
+MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+# Resume attempts after a dropped connection, per download (or per segment)
+RETRIES = 5
+PART_SUFFIX = ".part"
+
+# The User-Agent comes from the shared session. Byte offsets must refer to the
+# file itself for resuming to work, so no content encoding
+HEADERS = {"Accept-Encoding": "identity"}
+
+
+class _Pipeline:
+    """Hand pooled buffers from the reader to the hasher, then to the writer."""
+
+    def __init__(self, out_file, chunk_size, pool_size, sha512=None):
+        self.sha512 = sha512 or hashlib.sha512()
+        self.free = queue.Queue()
+        for _ in range(pool_size):
+            self.free.put(bytearray(chunk_size))
+        self.to_hash = queue.Queue()
+        self.to_write = queue.Queue()
+        self.error = None
+        self.failed = threading.Event()
+        self.hash_seconds = 0.0
+        # The hasher runs on its own thread, so its span is nested in the caller's by name
+        parent = metrics.current()
+        self.parent = parent.name if parent else None
+        self.threads = [
+            threading.Thread(target=self._run_hasher, daemon=True),
+            threading.Thread(target=self._run, args=(self.to_write, out_file.write, None), daemon=True),
+        ]
+
+    def _hash(self, data):
+        start = time.monotonic()
+        self.sha512.update(data)
+        self.hash_seconds += time.monotonic() - start
+        metrics.add_bytes(len(data))
+
+    def _run_hasher(self):
+        # A live span, so a profiled run samples memory while the hash runs
+        with metrics.span("hash", self.parent) as item:
+            self._run(self.to_hash, self._hash, self.to_write)
+            item.attrs["busy_seconds"] = self.hash_seconds
+
+    def _run(self, inbox, handle, outbox):
+        while True:
+            item = inbox.get()
+            if item is None:
+                if outbox is not None:
+                    outbox.put(None)
+                return
+            buf, length = item
+            if not self.failed.is_set():
+                try:
+                    handle(memoryview(buf)[:length])
+                except Exception as e:
+                    self.error = e
+                    self.failed.set()
+            if outbox is None or self.failed.is_set():
+                self.free.put(buf)
+            else:
+                outbox.put(item)
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def acquire(self):
+        """Take a free buffer, giving up if a worker thread has failed."""
+        while True:
+            if self.failed.is_set():
+                raise self.error
+            try:
+                return self.free.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def submit(self, buf, length):
+        self.to_hash.put((buf, length))
+
+    def finish(self):
+        self.to_hash.put(None)
+        for thread in self.threads:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+class _ReadInterrupted(Exception):
+    """The stream failed after ``filled`` bytes had been read into the buffer."""
+
+    def __init__(self, filled, cause):
+        super().__init__(str(cause))
+        self.filled = filled
+        self.cause = cause
+
+
+def _fill(raw, buf):
+    """Read from ``raw`` until ``buf`` is full or the stream ends."""
+    view = memoryview(buf)
+    filled = 0
+    while filled < len(buf):
+        try:
+            n = raw.readinto(view[filled:])
+        except Exception as e:
+            if not filled:
+                raise
+            # Keep what arrived before the failure so a resume does not fetch it again
+            raise _ReadInterrupted(filled, e) from e
+        if not n:
+            break
+        filled += n
+    return filled
+
+
+class _Partial:
+    """A ``.part`` file plus a sidecar recording which response it belongs to."""
+
+    def __init__(self, dest_path):
+        self.path = dest_path + PART_SUFFIX
+        self.meta_path = self.path + ".json"
+
+    def load(self, url):
+        """Return (bytes on disk, validators) of a partial download of ``url``, or (0, {})."""
+        try:
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+            size = os.path.getsize(self.path)
+        except (OSError, ValueError):
+            return 0, {}
+        if meta.get("url") != url or (meta.get("total") is not None and size > meta["total"]):
+            return 0, {}
+        return size, meta
+
+    def save(self, url, validators):
+        with open(self.meta_path, "w") as f:
+            json.dump(dict(validators, url=url), f)
+
+    def discard(self):
+        for path in (self.path, self.meta_path):
+            if os.path.exists(path):
+                os.unlink(path)
+
+
+def _validators(response, offset):
+    """Return the ETag/Last-Modified/total length a response describes."""
+    total = None
+    content_range = response.headers.get("content-range", "")
+    if response.status_code == 206 and "/" in content_range:
+        length = content_range.rsplit("/", 1)[1]
+        total = int(length) if length.isdigit() else None
+    elif response.headers.get("content-length", "").isdigit():
+        total = offset + int(response.headers["content-length"])
+    return {
+        "etag": response.headers.get("etag"),
+        "last_modified": response.headers.get("last-modified"),
+        "total": total,
+    }
+
+
+def _resume_matches(response, offset, saved):
+    """Check that a 206 response continues the file the partial data came from."""
+    if response.status_code != 206:
+        return False
+    if not response.headers.get("content-range", "").startswith(f"bytes {offset}-"):
+        return False
+    current = _validators(response, offset)
+    for key in ("etag", "last_modified", "total"):
+        if saved.get(key) is not None and current[key] is not None and saved[key] != current[key]:
+            return False
+    return True
+
+
+def _transient(error):
+    """Whether a failed request is worth resuming (not a 4xx answer)."""
+    response = getattr(error, "response", None)
+    return response is None or response.status_code >= 500
+
+
+def _rehash(path, size, sha512, chunk_size):
+    """Feed the first ``size`` bytes of ``path`` into ``sha512``."""
+    with open(path, "rb") as f:
+        remaining = size
+        while remaining:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                raise OSError(f"{path} is shorter than {size} bytes")
+            sha512.update(data)
+            remaining -= len(data)
+
+
+def _stream_download(url, dest_path, session, timeout, chunk_size, pool_size, retries=RETRIES):
+    """Stream ``url`` into ``dest_path``, resuming from a ``.part`` file after failures.
+
+    Partial data is only continued when the server answers the Range
+    request with a 206 whose ETag, Last-Modified and total length match
+    the ones recorded when the partial file was started; otherwise the
+    download restarts from zero.
+    """
+    print(f"::debug::Streaming download: {url}")
+    http = session or get_session()
+    start = time.monotonic()
+    partial = _Partial(dest_path)
+    offset, saved = partial.load(url)
+    sha512 = hashlib.sha512()
+    if offset:
+        print(f"::debug::Found {offset} bytes of an earlier partial download, rehashing")
+        with metrics.span("hash", resumed=True):
+            _rehash(partial.path, offset, sha512, chunk_size)
+            metrics.add_bytes(offset)
+    resumed_from = offset
+
+    attempt = 0
+    while True:
+        headers = dict(HEADERS)
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            if saved.get("etag") or saved.get("last_modified"):
+                headers["If-Range"] = saved.get("etag") or saved["last_modified"]
+        try:
+            with http.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                if offset and response.status_code == 416 and saved.get("total") == offset:
+                    print("::debug::Partial download is already complete")
+                    break
+                response.raise_for_status()
+                if offset and not _resume_matches(response, offset, saved):
+                    print(f"::debug::Server did not continue the partial download (status {response.status_code}), "
+                          "starting over")
+                    offset, resumed_from, sha512 = 0, 0, hashlib.sha512()
+                    if response.status_code != 200:
+                        raise requests.exceptions.RequestException("Resume mismatch, retrying from the start")
+                if not offset:
+                    saved = _validators(response, 0)
+                    partial.save(url, saved)
+                print(f"::debug::Download {'resumed at ' + str(offset) if offset else 'started'}, "
+                      f"content-length: {response.headers.get('content-length', 'unknown')}")
+
+                with open(partial.path, "r+b" if offset else "wb") as out_file:
+                    out_file.seek(offset)
+                    out_file.truncate()
+                    pipeline = _Pipeline(out_file, chunk_size, pool_size, sha512)
+                    pipeline.start()
+                    try:
+                        while True:
+                            buf = pipeline.acquire()
+                            try:
+                                length = _fill(response.raw, buf)
+                            except _ReadInterrupted as e:
+                                pipeline.submit(buf, e.filled)
+                                offset += e.filled
+                                raise e.cause
+                            if not length:
+                                pipeline.free.put(buf)
+                                break
+                            pipeline.submit(buf, length)
+                            offset += length
+                    finally:
+                        # Drains every submitted buffer, so the file and hash stay in step
+                        pipeline.finish()
+
+            if saved.get("total") is not None and offset < saved["total"]:
+                raise requests.exceptions.ChunkedEncodingError(
+                    f"Connection closed at {offset} of {saved['total']} bytes"
+                )
+            break
+        except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+            if attempt >= retries or not _transient(e):
+                raise
+            delay = backoff_delay(attempt)
+            attempt += 1
+            metrics.retry()
+            print(f"::debug::Download interrupted at {offset} bytes ({e}); resuming in {delay:.1f}s "
+                  f"(attempt {attempt}/{retries})")
+            time.sleep(delay)
+
+    os.replace(partial.path, dest_path)
+    partial.discard()
+    if resumed_from:
+        print(f"::debug::Resumed download reused {resumed_from} bytes from disk")
+    _report(offset - resumed_from, start)
+    return sha512.hexdigest(), offset
+
+
+def _report(size, start):
+    elapsed = max(time.monotonic() - start, 1e-9)
+    print(f"::debug::Downloaded {size} bytes in {elapsed:.2f}s ({size / elapsed / 1e6:.1f} MB/s)")
+
+
+def probe_ranges(url, session=None, timeout=(10, 60)):
+    """Return the content length if ``url`` supports byte ranges, else None."""
+    http = session or get_session()
+    response = http.head(url, headers=HEADERS, allow_redirects=True, timeout=timeout)
+    response.raise_for_status()
+    accept_ranges = response.headers.get("accept-ranges", "").lower()
+    length = response.headers.get("content-length")
+    print(f"::debug::Accept-Ranges: {accept_ranges or 'none'}, content-length: {length or 'unknown'}")
+    if accept_ranges != "bytes" or not length or not length.isdigit():
+        return None
+    return int(length)
+
+
+class _Segments:
+    """Track per-segment progress so the hasher can follow the contiguous prefix."""
+
+    def __init__(self, total, count):
+        step = -(-total // count)
+        self.bounds = [(start, min(start + step, total)) for start in range(0, total, step)]
+        self.done = [0] * len(self.bounds)
+        self.total = total
+        self.etag = None
+        self.error = None
+        self.cond = threading.Condition()
+
+    def check_same_file(self, response):
+        """Make sure every segment response comes from the same version of the file."""
+        content_range = response.headers.get("content-range", "")
+        if not content_range.endswith(f"/{self.total}"):
+            raise ValueError(f"Content-Range {content_range!r} does not match length {self.total}")
+        etag = response.headers.get("etag")
+        with self.cond:
+            if self.etag is None:
+                self.etag = etag
+            elif etag is not None and etag != self.etag:
+                raise ValueError(f"ETag changed during download: {self.etag} -> {etag}")
+
+    def advance(self, index, length):
+        with self.cond:
+            self.done[index] += length
+            self.cond.notify_all()
+
+    def fail(self, error):
+        with self.cond:
+            if self.error is None:
+                self.error = error
+            self.cond.notify_all()
+
+    def prefix(self):
+        """Number of bytes written contiguously from the start of the file."""
+        for (start, end), done in zip(self.bounds, self.done):
+            if start + done < end:
+                return start + done
+        return self.bounds[-1][1] if self.bounds else 0
+
+    def wait_past(self, offset):
+        with self.cond:
+            while self.error is None and self.prefix() <= offset:
+                self.cond.wait()
+            if self.error is not None:
+                raise self.error
+            return self.prefix()
+
+
+def _fetch_segment(url, fd, segments, index, session, timeout, chunk_size, retries=RETRIES):
+    """Fetch one segment, resuming from where it stopped after transient failures."""
+    start, end = segments.bounds[index]
+    http = session or get_session()
+    attempt = 0
+    while segments.error is None:
+        offset = start + segments.done[index]
+        if offset >= end:
+            return
+        headers = dict(HEADERS, Range=f"bytes={offset}-{end - 1}")
+        try:
+            with http.get(url, headers=headers, stream=True, timeout=timeout) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    raise ValueError(f"Expected 206 for range {offset}-{end - 1}, got {response.status_code}")
+                segments.check_same_file(response)
+                buf = bytearray(chunk_size)
+                view = memoryview(buf)
+                while offset < end and segments.error is None:
+                    try:
+                        length = _fill(response.raw, view[: min(chunk_size, end - offset)])
+                    except _ReadInterrupted as e:
+                        os.pwrite(fd, view[:e.filled], offset)
+                        offset += e.filled
+                        segments.advance(index, e.filled)
+                        raise e.cause
+                    if not length:
+                        raise requests.exceptions.ChunkedEncodingError(
+                            f"Range {start}-{end - 1} ended early at offset {offset}"
+                        )
+                    os.pwrite(fd, view[:length], offset)
+                    offset += length
+                    segments.advance(index, length)
+            return
+        except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+            if attempt >= retries or not _transient(e):
+                segments.fail(e)
+                return
+            delay = backoff_delay(attempt)
+            attempt += 1
+            metrics.retry()
+            print(f"::debug::Segment {index} interrupted at {offset} ({e}); resuming in {delay:.1f}s")
+            time.sleep(delay)
+        except Exception as e:
+            segments.fail(e)
+            return
+
+
+def _ranged_download(url, dest_path, total, connections, session, timeout, chunk_size):
+    count = max(1, min(connections, total // MIN_SEGMENT_SIZE))
+    print(f"::debug::Ranged download over {count} connections: {url}")
+    start = time.monotonic()
+    segments = _Segments(total, count)
+    sha512 = hashlib.sha512()
+    fd = os.open(dest_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, total)
+        workers = [
+            threading.Thread(
+                target=_fetch_segment,
+                args=(url, fd, segments, index, session, timeout, chunk_size),
+                daemon=True,
+            )
+            for index in range(len(segments.bounds))
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            with metrics.span("hash") as item:
+                hashed = 0
+                hash_seconds = 0.0
+                while hashed < total:
+                    ready = segments.wait_past(hashed)
+                    while hashed < ready:
+                        data = os.pread(fd, min(chunk_size, ready - hashed), hashed)
+                        hash_start = time.monotonic()
+                        sha512.update(data)
+                        hash_seconds += time.monotonic() - hash_start
+                        hashed += len(data)
+                item.bytes = hashed
+                item.attrs["busy_seconds"] = hash_seconds
+        finally:
+            for worker in workers:
+                worker.join()
+    finally:
+        os.close(fd)
+
+    _report(total, start)
+    return sha512.hexdigest(), total
+
+
+def download_appimage(url, dest_path, session=None, connections=1, timeout=(10, 60), chunk_size=CHUNK_SIZE,
+                      pool_size=POOL_SIZE):
+    """Download ``url`` into ``dest_path`` and return its (SHA-512 hex digest, size).
+
+    With ``connections`` > 1 the download is split into parallel Range
+    requests, falling back to a single stream when ranges are unsupported.
+    """
+    if connections > 1:
+        total = probe_ranges(url, session, timeout)
+        if total:
+            return _ranged_download(url, dest_path, total, connections, session, timeout, chunk_size)
+        print("::debug::Server does not support ranges, falling back to a single stream")
+    return _stream_download(url, dest_path, session, timeout, chunk_size, pool_size)
@@ -0,0 +1,223 @@
+"""Resolve the Electron major version a VS Code release is built against.
+
+VS Code pins Electron in its ``package-lock.json``. The lockfile is
+several MB, but the entries we need sit near the top, so it is scanned
+incrementally while streaming and the download stops as soon as an
+Electron version turns up. Tagged lockfiles never change, so results are
+kept in a persistent ``vscodeVersion -> electronNN`` cache.
+
+When the AppImage is at hand, the version can be read from the release
+itself instead: from an Electron ``version`` file if one is shipped, or
+from the ``Electron/x.y.z`` string compiled into the ``cursor`` binary.
+That scan stops at the first match, but the string sits wherever the
+linker put it, so in the worst case the whole binary is decompressed.
+The lockfile lookup is then only a fallback.
+"""
+import codecs
+import json
+import os
+import re
+import time
+
+import requests
+
+import metrics
+from cache import load_json, store_json
+from net import backoff_delay, get_session
+
+ELECTRON_FILE = "electron.json"
+VSCODE_RAW_URL = os.environ.get("VSCODE_RAW_URL", "https://raw.githubusercontent.com/microsoft/vscode").rstrip("/")
+LOCKFILE_URL = VSCODE_RAW_URL + "/refs/tags/{vscode_version}/package-lock.json"
+
+# JSON paths that pin Electron, in lockfile v2/v3 and legacy v1 layouts
+_ROOT_SPEC_PATHS = {
+    ("packages", "", "dependencies", "electron"),
+    ("packages", "", "devDependencies", "electron"),
+}
+_RESOLVED_PATHS = {
+    ("packages", "node_modules/electron", "version"),
+    ("dependencies", "electron", "version"),
+}
+_MAX_DEPTH = 4
+
+# A root dependency spec is only trusted when it pins a concrete version
+_PINNED_SPEC = re.compile(r"^[~^=v]*(\d+)\.\d+\.\d+")
+_MAJOR = re.compile(r"^v?(\d+)\.")
+
+# Paths inside the AppImage
+VERSION_FILE_PATH = "usr/share/cursor/version"
+BINARY_PATH = "usr/share/cursor/cursor"
+# Safety cap on the bytes decompressed by the binary scan. It is well above the
+# size of the binary (~200 MiB), so normally the whole binary may be scanned; it
+# only stops a corrupt or unexpected image from being decompressed without end
+BINARY_SCAN_LIMIT = int(os.environ.get("ELECTRON_SCAN_LIMIT", str(512 * 1024 * 1024)))
+_VERSION_FILE = re.compile(rb"^\s*v?(\d+)\.\d+\.\d+")
+_BINARY_VERSION = re.compile(rb"Electron/(\d+)\.\d+\.\d+")
+# Longest match we must not split between two scanned chunks
+_SCAN_OVERLAP = 64
+
+_TOKEN = re.compile(r'\s*(?:([{}\[\],:])|"((?:[^"\\]|\\.)*)"|([^\s{}\[\],:"]+))', re.S)
+
+
+class LockfileScanner:
+    """Incremental JSON tokenizer that tracks the key path of each scalar.
+
+    Feed text with :meth:`feed`; it returns ``electronNN`` once a pinned
+    Electron version is seen, otherwise None.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        # One entry per open container: [is_object, current_key, expecting_key]
+        self._stack = []
+        self.tokens = 0
+
+    def _path(self):
+        return tuple(frame[1] for frame in self._stack)
+
+    def _scalar(self, value):
+        if len(self._stack) > _MAX_DEPTH or not isinstance(value, str):
+            return None
+        path = self._path()
+        if path in _RESOLVED_PATHS:
+            match = _MAJOR.match(value)
+        elif path in _ROOT_SPEC_PATHS:
+            match = _PINNED_SPEC.match(value)
+        else:
+            return None
+        return f"electron{match.group(1)}" if match else None
+
+    def feed(self, text, final=False):
+        buffer = self._buffer + text
+        pos = 0
+        stack = self._stack
+        while True:
+            match = _TOKEN.match(buffer, pos)
+            if match is None or (match.end() == len(buffer) and not final):
+                break
+            pos = match.end()
+            self.tokens += 1
+            punct, string, literal = match.groups()
+            if punct:
+                if punct == "{":
+                    stack.append([True, None, True])
+                elif punct == "[":
+                    stack.append([False, None, False])
+                elif punct in "}]":
+                    stack.pop()
+                elif punct == ":":
+                    stack[-1][2] = False
+                elif stack[-1][0]:
+                    stack[-1][1], stack[-1][2] = None, True
+                continue
+            if string is not None and "\\" in string:
+                string = json.loads(f'"{string}"')
+            if stack and stack[-1][0] and stack[-1][2]:
+                stack[-1][1] = string
+                continue
+            found = self._scalar(string if string is not None else literal)
+            if found:
+                return found
+        self._buffer = buffer[pos:]
+        return None
+
+
+def scan_lockfile(chunks):
+    """Scan an iterable of byte chunks; return (electronNN or None, bytes consumed)."""
+    scanner = LockfileScanner()
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    consumed = 0
+    for chunk in chunks:
+        consumed += len(chunk)
+        found = scanner.feed(decoder.decode(chunk))
+        if found:
+            return found, consumed
+    return scanner.feed(decoder.decode(b"", final=True), final=True), consumed
+
+
+def scan_binary(chunks, limit=BINARY_SCAN_LIMIT):
+    """Search byte chunks of an Electron binary for its version; return (electronNN or None, bytes scanned)."""
+    tail = b""
+    scanned = 0
+    for chunk in chunks:
+        window = tail + chunk
+        match = _BINARY_VERSION.search(window)
+        if match:
+            return f"electron{int(match.group(1))}", scanned + match.end() - len(tail)
+        scanned += len(chunk)
+        if scanned >= limit:
+            break
+        tail = window[-_SCAN_OVERLAP:]
+    return None, scanned
+
+
+def electron_from_appimage(fs):
+    """Read the Electron version from an opened AppImage (``squashfs.SquashFS``), or None."""
+    try:
+        match = _VERSION_FILE.match(fs.read_file(VERSION_FILE_PATH))
+        if match:
+            print(f"::debug::Electron version file found in AppImage: {match.group(0).decode().strip()}")
+            return f"electron{int(match.group(1))}"
+    except FileNotFoundError:
+        pass
+
+    try:
+        inode = fs.lookup(BINARY_PATH)
+    except FileNotFoundError:
+        print(f"::debug::{BINARY_PATH} not found in AppImage")
+        return None
+    if not inode.is_file:
+        return None
+    electron_version, scanned = scan_binary(fs.iter_blocks(inode))
+    print(f"::debug::Scanned {scanned} bytes of {BINARY_PATH}: {electron_version or 'no Electron version found'}")
+    return electron_version
+
+
+def get_cached_electron(vscode_version):
+    entry = load_json(ELECTRON_FILE).get(vscode_version)
+    return entry.get("electron_version") if entry else None
+
+
+def put_cached_electron(vscode_version, electron_version):
+    entries = load_json(ELECTRON_FILE)
+    entries[vscode_version] = {"electron_version": electron_version, "stored_at": time.time()}
+    store_json(ELECTRON_FILE, entries)
+
+
+@metrics.timed("electron_lookup")
+def get_electron_version(vscode_version, session=None):
+    """Get the Electron package (e.g. ``electron37``) for a VS Code release tag."""
+    cached = get_cached_electron(vscode_version)
+    if cached:
+        print(f"::debug::Electron cache hit for VSCode {vscode_version}: {cached}")
+        return cached
+
+    url = LOCKFILE_URL.format(vscode_version=vscode_version)
+    http = session or get_session()
+    max_retries = 3
+    for attempt in range(max_retries + 1):
+        try:
+            print(f"::debug::Scanning {url} for Electron (attempt {attempt + 1})")
+            with http.get(url, stream=True, timeout=(10, 30)) as response:
+                if response.status_code == 404:
+                    print(f"::warning::No package-lock.json for VSCode tag {vscode_version}")
+                    return None
+                response.raise_for_status()
+                electron_version, consumed = scan_lockfile(response.iter_content(chunk_size=64 * 1024))
+            if not electron_version:
+                raise ValueError("Electron dependency not found in package-lock.json")
+            metrics.add_bytes(consumed)
+            print(f"::debug::Found {electron_version} after reading {consumed} bytes")
+            put_cached_electron(vscode_version, electron_version)
+            return electron_version
+
+        except (requests.exceptions.RequestException, ValueError) as e:
+            print(f"::debug::Failed to get Electron version (attempt {attempt + 1}): {str(e)}")
+            if attempt < max_retries:
+                metrics.retry()
+                delay = backoff_delay(attempt)
+                print(f"::debug::Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
+
+    print("::debug::Failed to determine Electron version after all retries")
+    return None
@@ -0,0 +1,59 @@
+"""Persisted validators for conditional HTTP requests.
+
+For each URL we remember the ``ETag``/``Last-Modified`` of the last 200
+response together with the result the caller parsed from it. The next
+request sends ``If-None-Match``/``If-Modified-Since`` and, on a 304, the
+caller gets the remembered result back without downloading or parsing
+the body again.
+"""
+import threading
+import time
+
+import requests
+
+import metrics
+from cache import load_json, store_json
+
+STATE_FILE = "http_state.json"
+
+_lock = threading.Lock()
+
+
+def conditional_get(url, session=None, headers=None, **kwargs):
+    """GET ``url`` conditionally; return (response, cached result or None).
+
+    The cached result is only returned for a 304 response.
+    """
+    with _lock:
+        entry = load_json(STATE_FILE).get(url)
+    request_headers = dict(headers or {})
+    if entry:
+        if entry.get("etag"):
+            request_headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            request_headers["If-Modified-Since"] = entry["last_modified"]
+
+    http = session or requests
+    response = http.get(url, headers=request_headers, **kwargs)
+    if response.status_code == 304 and entry:
+        print(f"::debug::Not modified (304): {url}")
+        return response, entry["result"]
+    metrics.add_bytes(len(response.content))
+    return response, None
+
+
+def remember(url, response, result):
+    """Store the validators of a 200 ``response`` along with its parsed ``result``."""
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if response.status_code != 200 or not (etag or last_modified):
+        return
+    with _lock:
+        state = load_json(STATE_FILE)
+        state[url] = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "result": result,
+            "stored_at": time.time(),
+        }
+        store_json(STATE_FILE, state)
@@ -0,0 +1,92 @@
+"""Reuse AppImages that are already on the build host.
+
+Build hosts keep Cursor AppImages in makepkg's ``SRCDEST`` or a shared
+artifact store. Before downloading a release, ``update_pkgbuild.py``
+looks there for ``Cursor-<version>-x86_64.AppImage`` (the upstream name)
+or ``<pkgname>-<pkgver>.AppImage`` (the name the PKGBUILD saves it under)
+and, once the file is verified to be that release, uses it for both the
+checksum and the extraction.
+
+Several commits can share a version, so a name match alone proves
+nothing, and the checksum written to the PKGBUILD must be that of the
+published file. A local file is therefore only used when it hashes to a
+checksum already known for the commit; otherwise the release is
+downloaded.
+"""
+import hashlib
+import mmap
+import os
+import time
+
+import metrics
+from cache import ARTIFACT_CACHE_MAX_AGE_DAYS, ARTIFACT_CACHE_MAX_ENTRIES, evict, load_json, store_json
+
+# Extra directories to search, separated like $PATH; $SRCDEST is searched as well
+APPIMAGE_SEARCH_DIRS = [path for path in os.environ.get("APPIMAGE_SEARCH_DIRS", "").split(os.pathsep) if path]
+
+# Checksums of local files by (path, size, mtime), so unchanged files are hashed once
+HASHES_FILE = "hashes.json"
+
+# Window hashed per step; mapped pages are dropped after each one to keep RSS flat
+HASH_WINDOW = 16 * 1024 * 1024
+
+
+def search_dirs(extra=()):
+    """Return the directories to search, configured ones first, without duplicates."""
+    dirs = []
+    for path in APPIMAGE_SEARCH_DIRS + [os.environ.get("SRCDEST", "")] + list(extra):
+        if path and os.path.isdir(path) and os.path.realpath(path) not in dirs:
+            dirs.append(os.path.realpath(path))
+    return dirs
+
+
+def find_appimage(version, pkgname, dirs):
+    """Return the first AppImage for ``version`` found in ``dirs``, or None."""
+    names = [f"Cursor-{version}-x86_64.AppImage"]
+    if pkgname:
+        names.append(f"{pkgname}-{version}.AppImage")
+    for directory in dirs:
+        for name in names:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def _memo_key(path, stat):
+    return f"{os.path.realpath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+@metrics.timed("hash")
+def hash_appimage(path):
+    """Return (SHA-512 hex digest, size) of ``path``, hashing it through a memory map.
+
+    Results are memoized by path, size and mtime, so a file that has not
+    changed since an earlier run is not read again.
+    """
+    stat = os.stat(path)
+    key = _memo_key(path, stat)
+    entry = load_json(HASHES_FILE).get(key)
+    if entry:
+        print(f"::debug::Hash memo hit for {path}")
+        return entry["sha512"], stat.st_size
+
+    sha512 = hashlib.sha512()
+    if stat.st_size:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mapped) as view:
+                for start in range(0, stat.st_size, HASH_WINDOW):
+                    end = min(start + HASH_WINDOW, stat.st_size)
+                    sha512.update(view[start:end])
+                    if hasattr(mapped, "madvise"):
+                        mapped.madvise(mmap.MADV_DONTNEED, start, end - start)
+    metrics.add_bytes(stat.st_size)
+    digest = sha512.hexdigest()
+
+    entries = load_json(HASHES_FILE)
+    entries[key] = {"sha512": digest, "stored_at": time.time()}
+    store_json(HASHES_FILE, evict(entries, ARTIFACT_CACHE_MAX_ENTRIES, ARTIFACT_CACHE_MAX_AGE_DAYS))
+    return digest, stat.st_size
+
@@ -0,0 +1,464 @@
+"""Lightweight timing spans and run reports.
+
+Phases are wrapped in :func:`span` (or decorated with :func:`timed`) and
+record their duration, bytes transferred and retry count. Code running
+inside a span reports into it through :func:`add_bytes` and
+:func:`retry` without having the span passed around; spans nest per
+thread.
+
+With :func:`start_profiling` every span also records the peak RSS and
+the peak memory traced by ``tracemalloc`` while it was open, and the
+allocation sites live at the run's traced peak are kept, so an
+out-of-memory run can be pinned on a phase. :func:`stop_profiling`
+summarizes them and :func:`check_memory_budget` fails the run if the
+peak RSS exceeded a budget.
+
+At the end of a run :func:`emit` writes the collected spans as a JSON
+report to ``$METRICS_REPORT`` and, if ``$METRICS_TEXTFILE`` is set, as a
+Prometheus textfile (for node_exporter's textfile collector). An
+existing report is extended rather than overwritten, so ``check.py`` and
+``update_pkgbuild.py`` run as separate steps end up in one report.
+"""
+import functools
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from cache import evict, load_json, store_json
+
+REPORT_PATH = os.environ.get("METRICS_REPORT")
+TEXTFILE_PATH = os.environ.get("METRICS_TEXTFILE")
+PREFIX = "cursor_updater"
+
+# First time each release commit was detected, for release-to-update latency
+RELEASES_FILE = "releases.json"
+RELEASES_MAX_ENTRIES = 100
+RELEASES_MAX_AGE_DAYS = 90
+
+# Memory profiling for scripts that support it (--profile), and an optional peak RSS limit
+PROFILE = os.environ.get("METRICS_PROFILE", "false").lower() == "true"
+MEMORY_BUDGET = os.environ.get("MEMORY_BUDGET") or None
+
+# Profiling: how often memory is sampled and how many allocation sites are reported
+PROFILE_INTERVAL = 0.02
+PROFILE_TOP = int(os.environ.get("PROFILE_TOP", "10"))
+# Traced growth needed before the peak snapshot is retaken (snapshots are not free)
+SNAPSHOT_STEP = 1024 * 1024
+
+_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+_lock = threading.Lock()
+_local = threading.local()
+_spans = []
+_gauges = {}
+_profile = {}
+_started_at = time.time()
+_profiler = None
+
+
+class MemoryBudgetExceeded(Exception):
+    """The peak RSS of a profiled run exceeded its memory budget."""
+
+
+class Span:
+    """One timed phase; ``bytes`` and ``retries`` are filled in while it runs."""
+
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.started_at = time.time()
+        self.duration = None
+        self.bytes = 0
+        self.retries = 0
+        self.error = None
+        self.rss_peak = None
+        self.traced_peak = None
+
+    def to_dict(self):
+        entry = {
+            "name": self.name,
+            "parent": self.parent,
+            "started_at": self.started_at,
+            "duration_seconds": self.duration,
+            "bytes": self.bytes,
+            "retries": self.retries,
+        }
+        if self.bytes and self.duration:
+            entry["throughput_bytes_per_second"] = self.bytes / self.duration
+        if self.error:
+            entry["error"] = self.error
+        if self.attrs:
+            entry["attrs"] = self.attrs
+        if self.rss_peak is not None:
+            entry["rss_peak_bytes"] = self.rss_peak
+            entry["traced_peak_bytes"] = self.traced_peak
+        return entry
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def current():
+    """Return the innermost open span on this thread, or None."""
+    stack = _stack()
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def span(name, parent=None, **attrs):
+    """Time a phase nested in this thread's innermost span, or in ``parent`` if given.
+
+    ``parent`` names the span of another thread that handed this work off.
+    """
+    stack = _stack()
+    if parent is None and stack:
+        parent = stack[-1].name
+    item = Span(name, parent, **attrs)
+    stack.append(item)
+    profiler = _profiler
+    if profiler:
+        profiler.open(item)
+    start = time.monotonic()
+    try:
+        yield item
+    except BaseException as e:
+        item.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        item.duration = time.monotonic() - start
+        stack.pop()
+        if profiler:
+            profiler.close(item)
+        with _lock:
+            _spans.append(item)
+
+
+def timed(name):
+    """Decorator running the wrapped function inside ``span(name)``."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record(name, duration, nbytes=0, **attrs):
+    """Record a phase that was timed elsewhere (e.g. on a worker thread)."""
+    parent = current()
+    item = Span(name, parent.name if parent else None, **attrs)
+    item.started_at -= duration
+    item.duration = duration
+    item.bytes = nbytes
+    with _lock:
+        _spans.append(item)
+
+
+def add_bytes(count):
+    item = current()
+    if item is not None:
+        item.bytes += count
+
+
+def retry():
+    item = current()
+    if item is not None:
+        item.retries += 1
+
+
+def gauge(name, value):
+    with _lock:
+        _gauges[name] = value
+
+
+def mark_release_detected(commit):
+    """Remember when ``commit`` was first detected and export it as a gauge."""
+    releases = load_json(RELEASES_FILE)
+    entry = releases.get(commit)
+    if entry is None:
+        entry = releases[commit] = {"stored_at": time.time()}
+        store_json(RELEASES_FILE, evict(releases, RELEASES_MAX_ENTRIES, RELEASES_MAX_AGE_DAYS))
+    gauge("release_detected_timestamp_seconds", entry["stored_at"])
+
+
+def mark_release_updated(commit):
+    """Export the time from first detecting ``commit`` to its PKGBUILD update."""
+    now = time.time()
+    gauge("pkgbuild_updated_timestamp_seconds", now)
+    entry = load_json(RELEASES_FILE).get(commit)
+    if entry:
+        gauge("release_to_update_seconds", now - entry["stored_at"])
+
+
+def parse_bytes(text):
+    """Parse a size such as ``512M`` or ``2G`` (binary units) into bytes."""
+    text = str(text).strip().upper().removesuffix("B").removesuffix("I")
+    if text and text[-1] in _UNITS:
+        return int(float(text[:-1]) * _UNITS[text[-1]])
+    return int(text)
+
+
+def _rss():
+    """Current resident set size in bytes (0 where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _Profiler:
+    """Samples RSS and traced memory into the open spans on a background thread."""
+
+    def __init__(self, budget, top):
+        self.budget = budget
+        self.top = top
+        self.spans = set()
+        self.rss_peak = 0
+        self.snapshot = None
+        self.snapshot_traced = 0
+        self.snapshot_phases = []
+        self._stop = threading.Event()
+        self._sample_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="metrics-profiler", daemon=True)
+
+    def start(self):
+        tracemalloc.start()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return traced_peak
+
+    def open(self, item):
+        with self._sample_lock:
+            self.spans.add(item)
+        self.sample()
+
+    def close(self, item):
+        self.sample()
+        with self._sample_lock:
+            self.spans.discard(item)
+
+    def sample(self):
+        rss = _rss()
+        traced = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        with self._sample_lock:
+            self.rss_peak = max(self.rss_peak, rss)
+            for item in self.spans:
+                item.rss_peak = max(item.rss_peak or 0, rss)
+                item.traced_peak = max(item.traced_peak or 0, traced)
+            if traced < self.snapshot_traced + SNAPSHOT_STEP:
+                return
+            self.snapshot_traced = traced
+            self.snapshot_phases = sorted({item.name for item in self.spans})
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        with self._sample_lock:
+            self.snapshot = snapshot
+
+    def _run(self):
+        while not self._stop.wait(PROFILE_INTERVAL):
+            self.sample()
+
+    def top_allocations(self):
+        if self.snapshot is None:
+            return []
+        return [
+            {"site": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+            for stat in self.snapshot.statistics("lineno")[:self.top]
+        ]
+
+
+def start_profiling(budget=None, top=PROFILE_TOP):
+    """Record memory use per span from now on; ``budget`` is a peak RSS limit (bytes or e.g. ``512M``)."""
+    global _profiler
+    if _profiler is not None:
+        return
+    _profiler = _Profiler(parse_bytes(budget) if budget else None, top)
+    _profiler.start()
+
+
+def stop_profiling():
+    """Stop profiling, add the memory summary to the report, print it and return it."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is None:
+        return None
+    traced_peak = profiler.stop()
+    summary = {
+        "rss_peak_bytes": max(profiler.rss_peak, _max_rss()),
+        "traced_peak_bytes": traced_peak,
+        "memory_budget_bytes": profiler.budget,
+        "peak_phases": profiler.snapshot_phases,
+        "top_allocations": profiler.top_allocations(),
+    }
+    with _lock:
+        _profile.update(summary)
+    gauge("rss_peak_bytes", summary["rss_peak_bytes"])
+    gauge("traced_peak_bytes", traced_peak)
+
+    print(f"Memory profile: peak RSS {summary['rss_peak_bytes'] / 2 ** 20:.1f} MiB,"
+          f" peak traced {traced_peak / 2 ** 20:.1f} MiB")
+    print(f"{'phase':>20} {'seconds':>8} {'peak RSS MiB':>13} {'peak traced MiB':>16}")
+    with _lock:
+        profiled = [item for item in _spans if item.rss_peak is not None]
+    for item in profiled:
+        print(f"{item.name:>20} {item.duration:8.2f} {item.rss_peak / 2 ** 20:13.1f}"
+              f" {item.traced_peak / 2 ** 20:16.1f}")
+    if summary["top_allocations"]:
+        print(f"Top allocation sites at the traced peak (during {', '.join(summary['peak_phases']) or 'no phase'}):")
+        for entry in summary["top_allocations"]:
+            print(f"  {entry['size_bytes'] / 1024:10.1f} KiB {entry['count']:7d} blocks  {entry['site']}")
+    return summary
+
+
+def check_memory_budget(summary):
+    """Raise :class:`MemoryBudgetExceeded` if a profiling ``summary`` is over its budget."""
+    if not summary or not summary["memory_budget_bytes"]:
+        return
+    if summary["rss_peak_bytes"] > summary["memory_budget_bytes"]:
+        raise MemoryBudgetExceeded(
+            f"Peak RSS {summary['rss_peak_bytes'] / 2 ** 20:.1f} MiB exceeds the memory budget of"
+            f" {summary['memory_budget_bytes'] / 2 ** 20:.1f} MiB"
+        )
+
+
+def reset():
+    """Forget collected spans and gauges, e.g. between ticks of a long-running process."""
+    global _started_at
+    with _lock:
+        _spans.clear()
+        _gauges.clear()
+        _profile.clear()
+        _started_at = time.time()
+
+
+def report():
+    """Return the spans and gauges collected so far in this process."""
+    with _lock:
+        data = {
+            "started_at": _started_at,
+            "finished_at": time.time(),
+            "spans": [item.to_dict() for item in _spans],
+            "gauges": dict(_gauges),
+        }
+        if _profile:
+            data["profile"] = dict(_profile)
+        return data
+
+
+def merge(old, new):
+    """Extend report ``old`` (from an earlier step of the same run) with ``new``."""
+    if not old:
+        return new
+    merged = {
+        "started_at": min(old.get("started_at", new["started_at"]), new["started_at"]),
+        "finished_at": new["finished_at"],
+        "spans": old.get("spans", []) + new["spans"],
+        "gauges": {**old.get("gauges", {}), **new["gauges"]},
+    }
+    profile = new.get("profile") or old.get("profile")
+    if profile:
+        merged["profile"] = profile
+    return merged
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus(data):
+    """Render a report as Prometheus text exposition format."""
+    totals = {}
+    for entry in data["spans"]:
+        phase = totals.setdefault(entry["name"], {"duration": 0.0, "bytes": 0, "retries": 0, "count": 0})
+        phase["duration"] += entry["duration_seconds"] or 0
+        phase["bytes"] += entry["bytes"]
+        phase["retries"] += entry["retries"]
+        phase["count"] += 1
+
+    series = [
+        ("phase_duration_seconds", "Time spent in each phase of the last run", "duration"),
+        ("phase_bytes", "Bytes transferred in each phase of the last run", "bytes"),
+        ("phase_retries", "Retries in each phase of the last run", "retries"),
+        ("phase_count", "Number of times each phase ran in the last run", "count"),
+    ]
+    lines = []
+    for metric, help_text, key in series:
+        lines.append(f"# HELP {PREFIX}_{metric} {help_text}")
+        lines.append(f"# TYPE {PREFIX}_{metric} gauge")
+        for name in sorted(totals):
+            lines.append(f'{PREFIX}_{metric}{{phase="{_label(name)}"}} {totals[name][key]}')
+
+    lines.append(f"# HELP {PREFIX}_phase_throughput_bytes_per_second Average throughput of each phase")
+    lines.append(f"# TYPE {PREFIX}_phase_throughput_bytes_per_second gauge")
+    for name in sorted(totals):
+        phase = totals[name]
+        if phase["bytes"] and phase["duration"]:
+            value = phase["bytes"] / phase["duration"]
+            lines.append(f'{PREFIX}_phase_throughput_bytes_per_second{{phase="{_label(name)}"}} {value}')
+
+    gauges = dict(data.get("gauges", {}))
+    gauges["run_duration_seconds"] = data["finished_at"] - data["started_at"]
+    gauges["last_run_timestamp_seconds"] = data["finished_at"]
+    for name in sorted(gauges):
+        lines.append(f"# TYPE {PREFIX}_{name} gauge")
+        lines.append(f"{PREFIX}_{name} {gauges[name]}")
+    return "\n".join(lines) + "\n"
+
+
+def _write_atomic(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+
+def emit(report_path=None, textfile_path=None, append=True):
+    """Write the run report and Prometheus textfile, if configured.
+
+    With ``append`` an existing report is extended instead of replaced.
+    """
+    report_path = report_path or REPORT_PATH
+    textfile_path = textfile_path or TEXTFILE_PATH
+    if not (report_path or textfile_path):
+        return None
+
+    data = report()
+    if report_path and append:
+        try:
+            with open(report_path, "r") as f:
+                data = merge(json.load(f), data)
+        except (OSError, ValueError):
+            pass
+    if report_path:
+        _write_atomic(report_path, json.dumps(data, indent=2) + "\n")
+        print(f"::debug::Metrics report written to {report_path}")
+    if textfile_path:
+        # The textfile collector only reads *.prom files, so write atomically
+        _write_atomic(textfile_path, prometheus(data))
+        print(f"::debug::Prometheus metrics written to {textfile_path}")
+    return data
@@ -0,0 +1,50 @@
+"""Shared HTTP session with keep-alive connection pooling.
+
+All requests made by one run go through a single ``requests.Session`` so
+that connections (and TLS handshakes) to the same host are reused, even
+when fetches run concurrently on worker threads.
+"""
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Explicit (connect, read) timeouts; requests has no default timeout
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 30
+TIMEOUT = (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+POOL_SIZE = 16
+
+# Retry backoff: base delay doubles per attempt up to the cap, half of it jittered
+BACKOFF_BASE = 2
+BACKOFF_CAP = 60
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36"
+    " (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36"
+)
+
+_session = None
+_lock = threading.Lock()
+
+
+def get_session():
+    """Return the process-wide pooled session, creating it on first use."""
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+            _session = session
+        return _session
+
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Seconds to wait before retry ``attempt`` (0-based): exponential with jitter."""
+    delay = min(cap, base * 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
@@ -0,0 +1,329 @@
+"""Structured PKGBUILD model with in-place rendering and .SRCINFO output.
+
+The PKGBUILD is tokenized in a single pass into assignments (global ones
+and simple ones inside functions such as ``package()``); everything else
+is kept verbatim. Changing a field re-renders only the lines of that
+assignment, preserving quoting and line breaks where possible, so the
+rest of the file round-trips byte for byte.
+
+``.SRCINFO`` is generated the way ``makepkg --printsrcinfo`` does for a
+single-package PKGBUILD, without needing makepkg or a container.
+
+Usage: python pkgbuild.py --srcinfo [PKGBUILD]
+"""
+import re
+import sys
+
+_ASSIGNMENT = re.compile(r"^(\s*)([A-Za-z_][A-Za-z0-9_]*)(\+?=)")
+_FUNCTION_START = re.compile(r"^\s*([A-Za-z_][A-Za-z0-9_-]*)\s*\(\)\s*\{?\s*(#.*)?$")
+_VARIABLE = re.compile(r"\$\{([A-Za-z_][A-Za-z0-9_]*)\}|\$([A-Za-z_][A-Za-z0-9_]*)")
+_BARE_SAFE = re.compile(r"^[A-Za-z0-9_@%+=:,./!${}-]+$")
+
+# Attribute order used by makepkg's srcinfo writer
+SRCINFO_SINGLE = ("pkgdesc", "pkgver", "pkgrel", "epoch", "url", "install", "changelog")
+HASH_ALGOS = ("ck", "md5", "sha1", "sha224", "sha256", "sha384", "sha512", "b2")
+SRCINFO_MULTI = (
+    "arch", "groups", "license", "checkdepends", "makedepends", "depends", "optdepends", "provides",
+    "conflicts", "replaces", "noextract", "options", "backup", "source", "validpgpkeys",
+) + tuple(f"{algo}sums" for algo in HASH_ALGOS)
+SRCINFO_ARCH_MULTI = (
+    "source", "provides", "conflicts", "depends", "replaces", "optdepends", "makedepends", "checkdepends",
+) + tuple(f"{algo}sums" for algo in HASH_ALGOS)
+
+
+class PKGBUILDError(Exception):
+    """The PKGBUILD could not be tokenized."""
+
+
+class Word:
+    """One shell word: its unquoted value, leading quote char and line break info."""
+
+    def __init__(self, value, quote, expandable, newline=None):
+        self.value = value
+        self.quote = quote
+        self.expandable = expandable
+        # Leading whitespace of the line this word starts, if it starts a new line
+        self.newline = newline
+
+
+class Assignment:
+    """``name=value`` or ``name=(...)`` spanning lines ``start..end`` (inclusive)."""
+
+    def __init__(self, name, op, function, start, end, indent, is_array, words, trailing):
+        self.name = name
+        self.op = op
+        self.function = function
+        self.start = start
+        self.end = end
+        self.indent = indent
+        self.is_array = is_array
+        self.words = words
+        self.trailing = trailing
+        self.dirty = False
+
+    @property
+    def value(self):
+        if self.is_array:
+            return [word.value for word in self.words]
+        return self.words[0].value if self.words else ""
+
+
+def _lex(text, pos, array):
+    """Split shell words starting at ``pos``.
+
+    Returns (words, end position, complete). For arrays, lexing stops after
+    the closing parenthesis; for scalars, after the first word. ``complete``
+    is False if the text ends inside a quote or before the closing paren.
+    """
+    words = []
+    newline = None
+    length = len(text)
+    while pos < length:
+        char = text[pos]
+        if not array and (words or char in " \t\n;#"):
+            break
+        if char == "\n":
+            pos += 1
+            line_end = text.find("\n", pos)
+            line = text[pos:] if line_end == -1 else text[pos:line_end]
+            newline = line[:len(line) - len(line.lstrip(" \t"))]
+            continue
+        if char in " \t":
+            pos += 1
+            continue
+        if char == "#":
+            line_end = text.find("\n", pos)
+            pos = length if line_end == -1 else line_end
+            continue
+        if array and char == ")":
+            return words, pos + 1, True
+
+        value = []
+        quote = None
+        expandable = True
+        while pos < length and text[pos] not in " \t\n" and not (array and text[pos] == ")") and text[pos] != ";":
+            char = text[pos]
+            if char == "'":
+                end = text.find("'", pos + 1)
+                if end == -1:
+                    return words, length, False
+                value.append(text[pos + 1:end])
+                quote = quote or "'"
+                expandable = False
+                pos = end + 1
+            elif char == '"':
+                pos += 1
+                while True:
+                    if pos >= length:
+                        return words, length, False
+                    char = text[pos]
+                    if char == '"':
+                        pos += 1
+                        break
+                    if char == "\\" and pos + 1 < length and text[pos + 1] in '"\\$`':
+                        value.append(text[pos + 1])
+                        pos += 2
+                    else:
+                        value.append(char)
+                        pos += 1
+                quote = quote or '"'
+            elif char == "\\" and pos + 1 < length:
+                value.append(text[pos + 1])
+                pos += 2
+            else:
+                value.append(char)
+                pos += 1
+        words.append(Word("".join(value), quote, expandable, newline))
+        newline = None
+    return words, pos, not array
+
+
+def _quote(value, quote):
+    """Quote ``value`` for the shell, keeping ``quote`` style when it is safe."""
+    if quote == "'" and "'" not in value and "$" not in value:
+        return f"'{value}'"
+    if quote is None and value and _BARE_SAFE.match(value):
+        return value
+    escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("`", "\\`")
+    return f'"{escaped}"'
+
+
+class PKGBUILD:
+    """Tokenized PKGBUILD that renders back with only changed fields rewritten."""
+
+    def __init__(self, lines, assignments):
+        self.lines = lines
+        self.assignments = assignments
+
+    @classmethod
+    def parse(cls, text):
+        lines = text.splitlines(keepends=True)
+        assignments = []
+        function = None
+        index = 0
+        while index < len(lines):
+            line = lines[index]
+            if function is None:
+                match = _FUNCTION_START.match(line)
+                if match:
+                    function = match.group(1)
+                    index += 1
+                    continue
+            elif line.rstrip() == "}":
+                function = None
+                index += 1
+                continue
+
+            match = _ASSIGNMENT.match(line)
+            if not match:
+                index += 1
+                continue
+            indent, name, op = match.groups()
+            is_array = line[match.end():].startswith("(")
+            start = index
+            body = line
+            pos = match.end() + (1 if is_array else 0)
+            while True:
+                words, end_pos, complete = _lex(body, pos, is_array)
+                if complete or index + 1 >= len(lines):
+                    break
+                index += 1
+                body += lines[index]
+            if not complete:
+                raise PKGBUILDError(f"Unterminated assignment to {name} on line {start + 1}")
+            trailing = body[end_pos:]
+            assignments.append(Assignment(name, op, function, start, index, indent, is_array, words, trailing))
+            index += 1
+        return cls(lines, assignments)
+
+    @classmethod
+    def load(cls, path="PKGBUILD"):
+        with open(path, "r") as f:
+            return cls.parse(f.read())
+
+    def find(self, name, function=None):
+        """Return the last plain ``=`` assignment to ``name`` in the given scope."""
+        found = None
+        for assignment in self.assignments:
+            if assignment.name == name and assignment.function == function and assignment.op == "=":
+                found = assignment
+        return found
+
+    def get(self, name, function=None, default=None):
+        assignment = self.find(name, function)
+        return assignment.value if assignment else default
+
+    def set(self, name, value, function=None):
+        """Change an existing assignment; a list value replaces an array."""
+        assignment = self.find(name, function)
+        if assignment is None:
+            raise KeyError(f"{name} is not assigned in PKGBUILD" + (f" function {function}()" if function else ""))
+        if isinstance(value, (list, tuple)):
+            if not assignment.is_array:
+                raise PKGBUILDError(f"{name} is not an array")
+            old = assignment.words
+            template = old[-1] if old else Word("", "'", True)
+            new_words = []
+            for i, item in enumerate(value):
+                base = old[i] if i < len(old) else Word("", template.quote, True, template.newline)
+                new_words.append(Word(str(item), base.quote, base.expandable, base.newline))
+            assignment.words = new_words
+        else:
+            base = assignment.words[0] if assignment.words else Word("", None, True)
+            assignment.words = [Word(str(value), base.quote, base.expandable)]
+        assignment.dirty = True
+
+    def set_item(self, name, index, value, function=None):
+        """Change one element of an array assignment."""
+        values = list(self.get(name, function) or [])
+        values[index] = value
+        self.set(name, values, function)
+
+    def _render_assignment(self, assignment):
+        if not assignment.is_array:
+            value = _quote(assignment.value, assignment.words[0].quote if assignment.words else None)
+            return f"{assignment.indent}{assignment.name}{assignment.op}{value}{assignment.trailing}"
+        parts = []
+        for i, word in enumerate(assignment.words):
+            text = _quote(word.value, word.quote)
+            if i == 0:
+                parts.append(text)
+            elif word.newline is not None:
+                parts.append(f"\n{word.newline}{text}")
+            else:
+                parts.append(f" {text}")
+        return f"{assignment.indent}{assignment.name}{assignment.op}({''.join(parts)}){assignment.trailing}"
+
+    def render(self):
+        """Return the PKGBUILD text with changed assignments rewritten in place."""
+        replaced = {assignment.start: assignment for assignment in self.assignments if assignment.dirty}
+        out = []
+        index = 0
+        while index < len(self.lines):
+            assignment = replaced.get(index)
+            if assignment is None:
+                out.append(self.lines[index])
+                index += 1
+            else:
+                out.append(self._render_assignment(assignment))
+                index = assignment.end + 1
+        return "".join(out)
+
+    def save(self, path="PKGBUILD"):
+        with open(path, "w") as f:
+            f.write(self.render())
+
+    # -- .SRCINFO ----------------------------------------------------------
+
+    def expand(self, word, _seen=()):
+        """Expand ``$var``/``${var}`` references against global scalar assignments."""
+        if not word.expandable:
+            return word.value
+
+        def substitute(match):
+            name = match.group(1) or match.group(2)
+            assignment = self.find(name)
+            if assignment is None or name in _seen:
+                return ""
+            if assignment.is_array:
+                return " ".join(self.expand(w, _seen + (name,)) for w in assignment.words)
+            return self.expand(assignment.words[0], _seen + (name,)) if assignment.words else ""
+
+        return _VARIABLE.sub(substitute, word.value)
+
+    def _values(self, name):
+        assignment = self.find(name)
+        if assignment is None:
+            return []
+        return [value for value in (self.expand(word) for word in assignment.words) if value]
+
+    def srcinfo(self):
+        """Return .SRCINFO content equivalent to ``makepkg --printsrcinfo``."""
+        pkgnames = self._values("pkgname")
+        pkgbase = (self._values("pkgbase") or pkgnames)[0]
+        out = [f"pkgbase = {pkgbase}\n"]
+        for attr in SRCINFO_SINGLE:
+            for value in self._values(attr)[:1]:
+                out.append(f"\t{attr} = {value}\n")
+        for attr in SRCINFO_MULTI:
+            for value in self._values(attr):
+                out.append(f"\t{attr} = {value}\n")
+        for arch in self._values("arch"):
+            if arch == "any":
+                continue
+            for attr in SRCINFO_ARCH_MULTI:
+                for value in self._values(f"{attr}_{arch}"):
+                    out.append(f"\t{attr}_{arch} = {value}\n")
+        out.append("\n")
+        for pkgname in pkgnames:
+            out.append(f"pkgname = {pkgname}\n\n")
+        return "".join(out)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args or args[0] != "--srcinfo" or len(args) > 2:
+        print("Usage: python pkgbuild.py --srcinfo [PKGBUILD]")
+        sys.exit(1)
+
+    sys.stdout.write(PKGBUILD.load(args[1] if len(args) == 2 else "PKGBUILD").srcinfo())
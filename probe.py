@@ -0,0 +1,100 @@
+"""Read files from a remote AppImage using HTTP Range requests only.
+
+The SquashFS reader only needs the ELF header, the superblock, the
+metadata blocks on the path to a file and that file's data blocks. Serving
+those from byte ranges lets us read ``product.json`` from a new release
+with a few hundred KB of traffic instead of downloading the whole image.
+
+Usage: python probe.py <appimage_url>
+"""
+import json
+import sys
+
+import requests
+
+import metrics
+from net import get_session
+from squashfs import SquashFS
+
+PAGE_SIZE = 64 * 1024
+PRODUCT_JSON_PATH = "usr/share/cursor/resources/app/product.json"
+
+
+class HTTPRangeSource:
+    """Byte source that fetches aligned pages of a URL on demand and keeps them."""
+
+    def __init__(self, url, session=None, page_size=PAGE_SIZE, timeout=(10, 30)):
+        self.url = url
+        self.session = session or get_session()
+        self.page_size = page_size
+        self.timeout = timeout
+        self.pages = {}
+        self.requests = 0
+        self.bytes_fetched = 0
+
+    def _fetch(self, first, last):
+        """Fetch pages ``first..last`` (inclusive) with a single Range request."""
+        start = first * self.page_size
+        end = (last + 1) * self.page_size - 1
+        headers = {"Range": f"bytes={start}-{end}"}
+        with self.session.get(self.url, headers=headers, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise requests.exceptions.RequestException(
+                    f"Server ignored Range request (status {response.status_code})"
+                )
+            data = response.raw.read(end - start + 1, decode_content=True)
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        metrics.add_bytes(len(data))
+        for index in range(first, last + 1):
+            offset = (index - first) * self.page_size
+            self.pages[index] = data[offset:offset + self.page_size]
+
+    def read(self, offset, size):
+        if size <= 0:
+            return b""
+        first = offset // self.page_size
+        last = (offset + size - 1) // self.page_size
+        # Coalesce each run of missing pages into one request
+        index = first
+        while index <= last:
+            if index in self.pages:
+                index += 1
+                continue
+            run_end = index
+            while run_end + 1 <= last and run_end + 1 not in self.pages:
+                run_end += 1
+            self._fetch(index, run_end)
+            index = run_end + 1
+        data = b"".join(self.pages[index] for index in range(first, last + 1))
+        start = offset - first * self.page_size
+        return data[start:start + size]
+
+    def close(self):
+        self.pages.clear()
+
+
+def probe_product_json(url, session=None):
+    """Return the parsed product.json of the AppImage at ``url``."""
+    print(f"::debug::Probing product.json with range requests: {url}")
+    source = HTTPRangeSource(url, session)
+    try:
+        fs = SquashFS(source)
+        product_data = json.loads(fs.read_file(PRODUCT_JSON_PATH))
+        print(
+            f"::debug::Probe read {source.bytes_fetched} bytes in {source.requests} requests"
+            f" (SquashFS at offset {fs.offset}, compression: {fs.compression})"
+        )
+        return product_data
+    finally:
+        source.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python probe.py <appimage_url>")
+        sys.exit(1)
+
+    product = probe_product_json(sys.argv[1])
+    print(json.dumps({key: product.get(key) for key in ("version", "vscodeVersion", "commit")}, indent=2))
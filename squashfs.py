@@ -0,0 +1,516 @@
+"""Read-only SquashFS 4.0 reader for pulling files out of an AppImage.
+
+AppImages are an ELF runtime followed by a SquashFS image. Instead of
+executing the runtime with ``--appimage-extract``, this module locates the
+image after the ELF section headers, walks the directory and inode tables,
+and decompresses only the blocks belonging to the requested file.
+
+Reads go through a *source* object exposing ``read(offset, size)``, so the
+same reader works on a local file or on anything else that
+can serve byte ranges. Only the standard library is required for gzip,
+lzma and xz images; zstd and lz4 images need the matching optional module.
+
+The module doubles as a standalone extraction tool, shipped with the AUR
+package so ``package()`` can pull several paths out of the AppImage in one
+pass, decompressing blocks on all cores:
+
+    python squashfs.py extract Cursor.AppImage [-C squashfs-root] PATH...
+"""
+import argparse
+import lzma
+import os
+import struct
+import sys
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+SQUASHFS_MAGIC = b"hsqs"
+SUPERBLOCK_SIZE = 96
+METADATA_SIZE = 8192
+INVALID_FRAGMENT = 0xFFFFFFFF
+
+# Data blocks per extraction task; large files are split so they decompress in parallel
+EXTRACT_CHUNK_BLOCKS = 32
+
+# How far into the file to search for the superblock if the ELF headers lie
+MAX_OFFSET_SCAN = 4 * 1024 * 1024
+
+BLOCK_UNCOMPRESSED = 1 << 24
+METADATA_UNCOMPRESSED = 1 << 15
+
+DIR_TYPES = (1, 8)
+FILE_TYPES = (2, 9)
+SYMLINK_TYPES = (3, 10)
+
+COMPRESSORS = {1: "gzip", 2: "lzma", 3: "lzo", 4: "xz", 5: "lz4", 6: "zstd"}
+
+_SUPERBLOCK = struct.Struct("<4sIIIIHHHHHHQQQQQQQQ")
+
+
+class SquashFSError(Exception):
+    """The image is not a SquashFS 4.0 filesystem this reader can handle."""
+
+
+class FileSource:
+    """Byte source reading a local file with ``pread``.
+
+    Unlike a memory map, pages read once (e.g. while scanning a large
+    binary) do not stay mapped into the process and inflate its RSS, and
+    concurrent reads from several threads need no locking.
+    """
+
+    def __init__(self, path):
+        self._fd = os.open(path, os.O_RDONLY)
+
+    def read(self, offset, size):
+        return os.pread(self._fd, size, offset)
+
+    def close(self):
+        os.close(self._fd)
+
+
+def find_squashfs_offset(source):
+    """Return the offset of the SquashFS superblock inside an AppImage.
+
+    The image starts right after the ELF runtime, i.e. at the end of its
+    section header table. A short scan is used as a fallback for runtimes
+    that append data after the section headers.
+    """
+    head = source.read(0, 64)
+    if head[:4] == SQUASHFS_MAGIC:
+        return 0
+    if head[:4] != b"\x7fELF" or len(head) < 64:
+        raise SquashFSError("Not an ELF AppImage or SquashFS image")
+
+    endian = "<" if head[5] == 1 else ">"
+    if head[4] == 2:
+        (shoff,) = struct.unpack_from(endian + "Q", head, 0x28)
+        shentsize, shnum = struct.unpack_from(endian + "HH", head, 0x3A)
+    else:
+        (shoff,) = struct.unpack_from(endian + "I", head, 0x20)
+        shentsize, shnum = struct.unpack_from(endian + "HH", head, 0x2E)
+    offset = shoff + shentsize * shnum
+    if _looks_like_superblock(source.read(offset, SUPERBLOCK_SIZE)):
+        return offset
+
+    window = source.read(0, MAX_OFFSET_SCAN)
+    position = window.find(SQUASHFS_MAGIC)
+    while position != -1:
+        if _looks_like_superblock(window[position:position + SUPERBLOCK_SIZE]):
+            return position
+        position = window.find(SQUASHFS_MAGIC, position + 1)
+    raise SquashFSError("SquashFS superblock not found after the ELF runtime")
+
+
+def _looks_like_superblock(data):
+    if len(data) < SUPERBLOCK_SIZE or data[:4] != SQUASHFS_MAGIC:
+        return False
+    fields = _SUPERBLOCK.unpack_from(data)
+    block_size, block_log, major = fields[3], fields[6], fields[9]
+    return major == 4 and block_log < 32 and block_size == 1 << block_log
+
+
+def _decompressor(compression_id, block_size):
+    name = COMPRESSORS.get(compression_id, str(compression_id))
+    if name == "gzip":
+        return zlib.decompress
+    if name == "xz":
+        return lambda data: lzma.decompress(data, format=lzma.FORMAT_XZ)
+    if name == "lzma":
+        return lambda data: lzma.decompress(data, format=lzma.FORMAT_ALONE)
+    if name == "zstd":
+        try:
+            from compression import zstd
+            return zstd.decompress
+        except ImportError:
+            pass
+        try:
+            import zstandard
+        except ImportError:
+            raise SquashFSError("zstd image requires Python 3.14+ or the zstandard module") from None
+        decompressor = zstandard.ZstdDecompressor()
+        return lambda data: decompressor.decompress(data, max_output_size=block_size)
+    if name == "lz4":
+        try:
+            import lz4.block
+        except ImportError:
+            raise SquashFSError("lz4 image requires the lz4 module") from None
+        return lambda data: lz4.block.decompress(data, uncompressed_size=block_size)
+    raise SquashFSError(f"Unsupported SquashFS compression: {name}")
+
+
+class Inode:
+    """Decoded inode; only the fields relevant to its type are set."""
+
+    def __init__(self, kind, mode, mtime, number):
+        self.kind = kind
+        self.mode = mode
+        self.mtime = mtime
+        self.number = number
+        # Directories
+        self.dir_block = 0
+        self.dir_offset = 0
+        self.dir_size = 0
+        # Regular files
+        self.file_size = 0
+        self.blocks_start = 0
+        self.block_sizes = ()
+        self.fragment = INVALID_FRAGMENT
+        self.fragment_offset = 0
+        # Symlinks
+        self.target = ""
+
+    @property
+    def is_dir(self):
+        return self.kind in DIR_TYPES
+
+    @property
+    def is_file(self):
+        return self.kind in FILE_TYPES
+
+    @property
+    def is_symlink(self):
+        return self.kind in SYMLINK_TYPES
+
+
+class _MetadataStream:
+    """Sequential reader over a chain of metadata blocks."""
+
+    def __init__(self, fs, block, offset):
+        self._fs = fs
+        self._data, self._next = fs._metadata_block(block)
+        self._pos = offset
+
+    def read(self, size):
+        chunks = []
+        while size > 0:
+            if self._pos >= len(self._data):
+                self._pos -= len(self._data)
+                self._data, self._next = self._fs._metadata_block(self._next)
+                continue
+            chunk = self._data[self._pos:self._pos + size]
+            chunks.append(chunk)
+            self._pos += len(chunk)
+            size -= len(chunk)
+        return b"".join(chunks)
+
+    def unpack(self, fmt):
+        return struct.unpack("<" + fmt, self.read(struct.calcsize("<" + fmt)))
+
+
+class SquashFS:
+    """SquashFS image located at ``offset`` within ``source``."""
+
+    def __init__(self, source, offset=None):
+        self.source = source
+        self.offset = find_squashfs_offset(source) if offset is None else offset
+        superblock = source.read(self.offset, SUPERBLOCK_SIZE)
+        if not _looks_like_superblock(superblock):
+            raise SquashFSError(f"No SquashFS 4.0 superblock at offset {self.offset}")
+        (
+            _magic,
+            self.inode_count,
+            self.mtime,
+            self.block_size,
+            self.fragment_count,
+            self.compression_id,
+            _block_log,
+            self.flags,
+            _id_count,
+            _major,
+            _minor,
+            self.root_inode,
+            self.bytes_used,
+            _id_table,
+            _xattr_table,
+            self.inode_table,
+            self.directory_table,
+            self.fragment_table,
+            _export_table,
+        ) = _SUPERBLOCK.unpack(superblock)
+        self.compression = COMPRESSORS.get(self.compression_id, str(self.compression_id))
+        self._decompress = _decompressor(self.compression_id, self.block_size)
+        self._metadata_cache = {}
+        self._fragment_entries = {}
+        self._fragment_cache = {}
+        self._fragment_lock = threading.Lock()
+
+    def close(self):
+        self.source.close()
+
+    # -- low level -------------------------------------------------------
+
+    def _read(self, position, size):
+        data = self.source.read(self.offset + position, size)
+        if len(data) != size:
+            raise SquashFSError(f"Short read at {position}: wanted {size}, got {len(data)}")
+        return data
+
+    def _metadata_block(self, position):
+        """Return (uncompressed data, position of the next block)."""
+        cached = self._metadata_cache.get(position)
+        if cached is None:
+            (header,) = struct.unpack("<H", self._read(position, 2))
+            size = header & ~METADATA_UNCOMPRESSED
+            data = self._read(position + 2, size)
+            if not header & METADATA_UNCOMPRESSED:
+                data = self._decompress(data)
+            cached = self._metadata_cache[position] = (data, position + 2 + size)
+        return cached
+
+    def _data_block(self, position, size_field, expected):
+        size = size_field & ~BLOCK_UNCOMPRESSED
+        if size == 0:
+            return bytes(expected)
+        data = self._read(position, size)
+        if not size_field & BLOCK_UNCOMPRESSED:
+            data = self._decompress(data)
+        return data
+
+    # -- inodes and directories -----------------------------------------
+
+    def inode(self, ref):
+        """Decode the inode at ``ref`` (metadata block << 16 | offset)."""
+        stream = _MetadataStream(self, self.inode_table + (ref >> 16), ref & 0xFFFF)
+        kind, mode, _uid, _gid, mtime, number = stream.unpack("HHHHII")
+        inode = Inode(kind, mode, mtime, number)
+        if kind == 1:
+            inode.dir_block, _links, size, inode.dir_offset, _parent = stream.unpack("IIHHI")
+            inode.dir_size = size - 3
+        elif kind == 8:
+            _links, size, inode.dir_block, _parent, _index_count, inode.dir_offset, _xattr = stream.unpack("IIIIHHI")
+            inode.dir_size = size - 3
+        elif kind in FILE_TYPES:
+            if kind == 2:
+                inode.blocks_start, inode.fragment, inode.fragment_offset, inode.file_size = stream.unpack("IIII")
+            else:
+                (inode.blocks_start, inode.file_size, _sparse, _links, inode.fragment, inode.fragment_offset,
+                 _xattr) = stream.unpack("QQQIIII")
+            count = inode.file_size // self.block_size
+            if inode.fragment == INVALID_FRAGMENT and inode.file_size % self.block_size:
+                count += 1
+            inode.block_sizes = stream.unpack(f"{count}I") if count else ()
+        elif kind in SYMLINK_TYPES:
+            _links, target_size = stream.unpack("II")
+            inode.target = stream.read(target_size).decode("utf-8", "surrogateescape")
+        return inode
+
+    def listdir(self, inode):
+        """Return ``[(name, inode_ref), ...]`` for a directory inode."""
+        if not inode.is_dir:
+            raise SquashFSError("Not a directory")
+        entries = []
+        if inode.dir_size <= 0:
+            return entries
+        stream = _MetadataStream(self, self.directory_table + inode.dir_block, inode.dir_offset)
+        remaining = inode.dir_size
+        while remaining > 0:
+            count, start, _base = stream.unpack("III")
+            remaining -= 12
+            for _ in range(count + 1):
+                offset, _delta, _kind, name_size = stream.unpack("HhHH")
+                name = stream.read(name_size + 1).decode("utf-8", "surrogateescape")
+                remaining -= 8 + name_size + 1
+                entries.append((name, (start << 16) | offset))
+        return entries
+
+    def walk(self, path):
+        """Yield ``(relative path, inode)`` for ``path`` and everything below it, parents first."""
+        root = path.strip("/")
+        stack = [(root, self.lookup(root))]
+        while stack:
+            relative, inode = stack.pop()
+            yield relative, inode
+            if inode.is_dir:
+                for name, ref in reversed(self.listdir(inode)):
+                    if name in (".", "..") or "/" in name:
+                        raise SquashFSError(f"Unsafe entry name {name!r} in {relative or '/'}")
+                    stack.append((f"{relative}/{name}" if relative else name, self.inode(ref)))
+
+    def lookup(self, path):
+        """Return the inode for ``path`` (relative to the image root)."""
+        inode = self.inode(self.root_inode)
+        for part in [p for p in path.strip("/").split("/") if p and p != "."]:
+            for name, ref in self.listdir(inode):
+                if name == part:
+                    inode = self.inode(ref)
+                    break
+            else:
+                raise FileNotFoundError(path)
+        return inode
+
+    # -- file contents ---------------------------------------------------
+
+    def _fragment_entry(self, index):
+        entry = self._fragment_entries.get(index)
+        if entry is None:
+            table_index, slot = divmod(index, METADATA_SIZE // 16)
+            (pointer,) = struct.unpack("<Q", self._read(self.fragment_table + 8 * table_index, 8))
+            data, _next = self._metadata_block(pointer)
+            start, size, _unused = struct.unpack_from("<QII", data, slot * 16)
+            entry = self._fragment_entries[index] = (start, size)
+        return entry
+
+    def _fragment(self, index):
+        with self._fragment_lock:
+            data = self._fragment_cache.get(index)
+        if data is None:
+            start, size = self._fragment_entry(index)
+            data = self._data_block(start, size, self.block_size)
+            with self._fragment_lock:
+                if len(self._fragment_cache) >= 8:
+                    self._fragment_cache.pop(next(iter(self._fragment_cache)))
+                self._fragment_cache[index] = data
+        return data
+
+    def block_layout(self, inode):
+        """Yield (position, size field, uncompressed length) for each data block."""
+        position = inode.blocks_start
+        remaining = inode.file_size
+        for size_field in inode.block_sizes:
+            length = min(self.block_size, remaining)
+            yield position, size_field, length
+            position += size_field & ~BLOCK_UNCOMPRESSED
+            remaining -= length
+
+    def iter_blocks(self, inode):
+        """Yield the decompressed contents of a regular file block by block."""
+        if not inode.is_file:
+            raise SquashFSError("Not a regular file")
+        for position, size_field, length in self.block_layout(inode):
+            yield self._data_block(position, size_field, length)[:length]
+        yield self.tail(inode)
+
+    def tail(self, inode):
+        """Return the part of a file stored in a fragment block (may be empty)."""
+        if inode.fragment == INVALID_FRAGMENT:
+            return b""
+        length = inode.file_size % self.block_size
+        return self._fragment(inode.fragment)[inode.fragment_offset:inode.fragment_offset + length]
+
+    def read_file(self, path):
+        """Return the full contents of the regular file at ``path``."""
+        inode = self.lookup(path)
+        if inode.is_symlink:
+            raise SquashFSError(f"{path} is a symlink to {inode.target}")
+        return b"".join(self.iter_blocks(inode))
+
+
+def _write_blocks(fs, target, inode, blocks, offset, with_tail):
+    """Decompress ``blocks`` of ``inode`` into ``target`` starting at ``offset``."""
+    fd = os.open(target, os.O_WRONLY)
+    try:
+        for position, size_field, length in blocks:
+            # Sparse blocks are already zero in the preallocated file
+            if size_field & ~BLOCK_UNCOMPRESSED:
+                os.pwrite(fd, fs._data_block(position, size_field, length)[:length], offset)
+            offset += length
+        if with_tail:
+            tail = fs.tail(inode)
+            if tail:
+                os.pwrite(fd, tail, offset)
+    finally:
+        os.close(fd)
+
+
+def _replace(target):
+    if os.path.islink(target) or (os.path.lexists(target) and not os.path.isdir(target)):
+        os.unlink(target)
+
+
+def extract(fs, paths, dest, workers=None):
+    """Extract ``paths`` (files, symlinks or whole directories) from ``fs`` below ``dest``.
+
+    Directory tables are read once, then file data is decompressed on
+    ``workers`` threads (zlib, lzma and zstd release the GIL), with large
+    files split into ranges of blocks. Modes, mtimes and symlinks are
+    preserved. Missing paths are reported on stderr and skipped, like
+    ``--appimage-extract`` does. Returns the number of entries extracted.
+    """
+    dirs = []
+    files = []
+    count = 0
+    for path in paths:
+        try:
+            entries = list(fs.walk(path))
+        except FileNotFoundError:
+            print(f"{path}: not found in image, skipping", file=sys.stderr)
+            continue
+        for relative, inode in entries:
+            target = os.path.join(dest, relative) if relative else dest
+            count += 1
+            if inode.is_dir:
+                if os.path.islink(target):
+                    os.unlink(target)
+                os.makedirs(target, exist_ok=True)
+                dirs.append((target, inode))
+                continue
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            _replace(target)
+            if inode.is_symlink:
+                os.symlink(inode.target, target)
+                os.utime(target, (inode.mtime, inode.mtime), follow_symlinks=False)
+            elif inode.is_file:
+                with open(target, "wb") as f:
+                    f.truncate(inode.file_size)
+                files.append((target, inode))
+            else:
+                count -= 1
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        futures = []
+        for target, inode in files:
+            layout = list(fs.block_layout(inode))
+            step = EXTRACT_CHUNK_BLOCKS
+            offset = 0
+            for start in range(0, max(len(layout), 1), step):
+                blocks = layout[start:start + step]
+                last = start + step >= len(layout)
+                futures.append(pool.submit(_write_blocks, fs, target, inode, blocks, offset, last))
+                offset += sum(length for _position, _size, length in blocks)
+        for future in futures:
+            future.result()
+
+    for target, inode in files:
+        os.chmod(target, inode.mode & 0o7777)
+        os.utime(target, (inode.mtime, inode.mtime))
+    # Deepest directories first, so setting a parent's mtime is not undone by its children
+    for target, inode in reversed(dirs):
+        os.chmod(target, inode.mode & 0o7777)
+        os.utime(target, (inode.mtime, inode.mtime))
+    return count
+
+
+def open_appimage(path):
+    """Open the SquashFS image embedded in the AppImage at ``path``."""
+    source = FileSource(path)
+    try:
+        return SquashFS(source)
+    except Exception:
+        source.close()
+        raise
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract files from the SquashFS image of an AppImage")
+    commands = parser.add_subparsers(dest="command", required=True)
+    extract_parser = commands.add_parser("extract", help="extract paths in a single pass")
+    extract_parser.add_argument("appimage")
+    extract_parser.add_argument("paths", nargs="+", metavar="PATH")
+    extract_parser.add_argument("-C", "--directory", default="squashfs-root", help="output directory")
+    extract_parser.add_argument("-j", "--jobs", type=int, default=None, help="decompression threads")
+    args = parser.parse_args()
+
+    try:
+        image = open_appimage(args.appimage)
+    except (OSError, SquashFSError) as e:
+        print(f"{args.appimage}: {e}", file=sys.stderr)
+        sys.exit(1)
+    try:
+        extract(image, args.paths, args.directory, args.jobs)
+    except (OSError, SquashFSError) as e:
+        print(f"Extraction failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        image.close()
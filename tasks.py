@@ -0,0 +1,102 @@
+"""Tiny dependency-driven task scheduler.
+
+Tasks are added with the names of the tasks they depend on and start on a
+thread pool as soon as those have finished, receiving their results as
+positional arguments. Independent work, such as downloading the AppImage
+and looking up release metadata over the network, therefore overlaps
+without hand-written thread juggling. Each task runs inside a metrics
+span named after it.
+
+Speculative work that is only sometimes needed is added as a
+``background`` task: it starts like any other, but nothing waits for it,
+so a slow or hanging request cannot hold up the run or the interpreter's
+exit.
+"""
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import metrics
+
+
+class TaskGraph:
+    """A set of named tasks and their dependencies."""
+
+    def __init__(self):
+        self._tasks = {}
+
+    def add(self, name, func, deps=(), optional=False, background=False, **attrs):
+        """Add ``func(*results of deps)`` as task ``name``.
+
+        Dependencies must already have been added, which also rules out
+        cycles. If an ``optional`` task fails, its result is None instead
+        of failing the whole run. A ``background`` task runs on a daemon
+        thread that :meth:`run` does not wait for; its result is a
+        :class:`~concurrent.futures.Future` resolving to None on failure,
+        and no other task can depend on it. ``attrs`` are recorded on its
+        span.
+        """
+        if name in self._tasks:
+            raise ValueError(f"Task {name} already added")
+        for dep in deps:
+            if dep not in self._tasks:
+                raise ValueError(f"Task {name} depends on unknown task {dep}")
+            if self._tasks[dep][3]:
+                raise ValueError(f"Task {name} cannot depend on background task {dep}")
+        self._tasks[name] = (func, tuple(deps), optional, background, attrs)
+        return name
+
+    @staticmethod
+    def _call(name, func, args, parent, attrs):
+        with metrics.span(name, parent, **attrs):
+            return func(*args)
+
+    def _start_background(self, name, func, args, parent, attrs):
+        future = Future()
+
+        def target():
+            try:
+                future.set_result(self._call(name, func, args, parent, attrs))
+            except Exception as e:
+                print(f"::debug::Background task {name} failed: {str(e)}")
+                future.set_result(None)
+
+        threading.Thread(target=target, name=f"task-{name}", daemon=True).start()
+        return future
+
+    def run(self, max_workers=None):
+        """Run every task and return ``{name: result}``.
+
+        The first failure of a required task is raised once the tasks
+        already running have finished; tasks that have not started yet
+        are skipped. Background tasks may still be running on return.
+        """
+        # Worker threads have no spans of their own, so nest tasks in the caller's
+        parent = metrics.current()
+        parent = parent.name if parent else None
+        results = {}
+        pending = dict(self._tasks)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers or max(1, len(pending))) as pool:
+            while pending or running:
+                for name, (func, deps, optional, background, attrs) in list(pending.items()):
+                    if all(dep in results for dep in deps):
+                        del pending[name]
+                        args = [results[dep] for dep in deps]
+                        if background:
+                            results[name] = self._start_background(name, func, args, parent, attrs)
+                        else:
+                            future = pool.submit(self._call, name, func, args, parent, attrs)
+                            running[future] = (name, optional)
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, optional = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        if not optional:
+                            raise
+                        print(f"::debug::Optional task {name} failed: {str(e)}")
+                        results[name] = None
+        return results
@@ -0,0 +1,109 @@
+"""Ranged and streamed downloads must produce the same file and SHA-512.
+
+Both are run against a local ``http.server`` that either supports byte
+ranges or, like some mirrors, ignores them and does not send
+``Accept-Ranges``.
+"""
+import hashlib
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import download  # noqa: E402
+
+_RANGE = re.compile(r"bytes=(\d+)-(\d*)$")
+
+SIZE = 3 * 1024 * 1024 + 12345
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, payload, ranges):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.payload = payload
+        self.ranges = ranges
+        self.requests = []
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/Cursor.AppImage"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _headers(self, status, length, content_range=None):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(length))
+        self.send_header("ETag", '"test"')
+        if self.server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if content_range:
+            self.send_header("Content-Range", content_range)
+        self.end_headers()
+
+    def do_HEAD(self):
+        self.server.requests.append(("HEAD", None))
+        self._headers(200, len(self.server.payload))
+
+    def do_GET(self):
+        payload = self.server.payload
+        requested = self.headers.get("Range")
+        self.server.requests.append(("GET", requested))
+        match = _RANGE.match(requested or "")
+        if self.server.ranges and match:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(payload) - 1
+            self._headers(206, end - start + 1, f"bytes {start}-{end}/{len(payload)}")
+            self.wfile.write(payload[start:end + 1])
+        else:
+            self._headers(200, len(payload))
+            self.wfile.write(payload)
+
+
+@pytest.fixture
+def payload():
+    return os.urandom(SIZE)
+
+
+@pytest.fixture(params=[True, False], ids=["ranges", "no-ranges"])
+def server(request, payload):
+    server = _Server(payload, ranges=request.param)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_parallel_download_matches_stream(server, payload, tmp_path, monkeypatch):
+    # Small segments so a few MiB are split over every connection
+    monkeypatch.setattr(download, "MIN_SEGMENT_SIZE", 512 * 1024)
+    streamed = tmp_path / "streamed.AppImage"
+    parallel = tmp_path / "parallel.AppImage"
+
+    expected = download._stream_download(server.url, str(streamed), None, (5, 5), 64 * 1024, 4)
+    server.requests.clear()
+    result = download.download_appimage(server.url, str(parallel), connections=4, chunk_size=64 * 1024)
+
+    assert expected == (hashlib.sha512(payload).hexdigest(), SIZE)
+    assert result == expected
+    assert parallel.read_bytes() == streamed.read_bytes() == payload
+
+    gets = [requested for method, requested in server.requests if method == "GET"]
+    if server.ranges:
+        assert len(gets) == 4 and all(gets)
+    else:
+        # No Accept-Ranges: a single plain GET, as in the streamed download
+        assert gets == [None]
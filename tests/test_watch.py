@@ -0,0 +1,49 @@
+"""A failed watch tick must back off instead of stopping the watcher."""
+import argparse
+import os
+import sys
+
+import urllib3
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import watch  # noqa: E402
+
+
+def test_run_keeps_looping_after_protocol_error(monkeypatch):
+    monkeypatch.setattr(watch, "load_json", lambda name: {})
+    monkeypatch.setattr(watch, "store_json", lambda name, data: None)
+    monkeypatch.setattr(watch.metrics, "emit", lambda append=True: None)
+    commits = iter(["a" * 40, "b" * 40, "c" * 40])
+    monkeypatch.setattr(
+        watch, "get_latest_commit_and_version", lambda *args, **kwargs: (next(commits), "2.0.0", None)
+    )
+    args = argparse.Namespace(
+        platform="linux-x64", release_track="latest", pkgbuild="PKGBUILD",
+        min_interval=120, max_interval=300, on_update=None,
+    )
+    watcher = watch.Watcher(args, session=object())
+
+    updates = []
+
+    def run_update():
+        updates.append(len(updates))
+        if len(updates) < 3:
+            raise urllib3.exceptions.ProtocolError("Connection broken: dropped")
+
+    delays = []
+
+    def wait(delay):
+        delays.append(delay)
+        if len(delays) == 3:
+            watcher.stop.set()
+
+    monkeypatch.setattr(watcher, "_run_update", run_update)
+    monkeypatch.setattr(watcher.stop, "wait", wait)
+    watcher.run()
+
+    assert len(updates) == 3
+    # Two failed ticks backed off, then the third succeeded and reset the count
+    assert watcher.failures == 0
+    assert all(30 <= delay <= 300 for delay in delays)
+    assert watcher.state["commit"] == "c" * 40
@@ -3,13 +3,27 @@ import json
 import os
 import base64
 import hashlib
-import requests
-import re
 import tempfile
 import subprocess
 
+import metrics
+from cache import cache_path, get_artifact, put_artifact
+from download import download_appimage
+from electron import electron_from_appimage, get_electron_version
+from local_appimage import find_appimage, hash_appimage, search_dirs
+from net import get_session
+from pkgbuild import PKGBUILD
+from probe import PRODUCT_JSON_PATH, probe_product_json
+from squashfs import SquashFSError, open_appimage
+from tasks import TaskGraph
+
 DEBUG = os.environ.get("DEBUG", "false").lower() == "true"
 
+# Number of parallel ranged connections used to fetch the AppImage (1 = single stream)
+DOWNLOAD_CONNECTIONS = int(os.environ.get("DOWNLOAD_CONNECTIONS", "1"))
+
+DOWNLOADS_URL = os.environ.get("CURSOR_DOWNLOADS_URL", "https://downloads.cursor.com").rstrip("/")
+
 
 def debug_print(*args, **kwargs):
     if DEBUG:
@@ -20,241 +34,263 @@ def base64_to_hex(base64_string):
     return base64.b64decode(base64_string).hex()
 
 
-def get_electron_version(vscode_version):
-    """Get the Electron version from VSCode's package-lock.json."""
-    debug_print(f"Starting get_electron_version for VSCode {vscode_version}")
-    url = f"https://raw.githubusercontent.com/microsoft/vscode/refs/tags/{vscode_version}/package-lock.json"
-    debug_print(f"URL: {url}")
-    headers = {
-        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36"
-        " (KHTML, like Gecko) Chrome/128.0.0.0 Safari/537.36",
-    }
-
-    max_retries = 3
-    for attempt in range(max_retries + 1):
-        try:
-            debug_print(f"Fetching Electron version for VSCode {vscode_version} (attempt {attempt + 1})")
-            response = requests.get(url, headers=headers)
-            debug_print(f"Response status: {response.status_code}")
-            response.raise_for_status()
-            debug_print("Response successful, parsing JSON...")
-
-            # Parse the package-lock.json to find electron version
-            data = response.json()
-            debug_print("JSON parsed successfully")
-            debug_print(f"JSON keys: {list(data.keys())}")
-
-            # Try different possible locations for electron version
-            electron_version = None
-
-            # Method 1: Check root dependencies (old format)
-            debug_print("Checking Method 1: root dependencies...")
-            if 'dependencies' in data and 'electron' in data['dependencies']:
-                electron_version = data['dependencies']['electron']['version']
-                debug_print(f"Found electron in root dependencies: {electron_version}")
-            else:
-                debug_print("Method 1 failed: no root dependencies or electron not found")
-
-            # Method 2: Check packages structure (new format)
-            debug_print("Checking Method 2: packages root dependencies...")
-            if 'packages' in data and '' in data['packages']:
-                root_package = data['packages']['']
-                if 'dependencies' in root_package and 'electron' in root_package['dependencies']:
-                    electron_version = root_package['dependencies']['electron']
-                    debug_print(f"Found electron in packages root dependencies: {electron_version}")
-                else:
-                    debug_print("Method 2 failed: no root package dependencies or electron not found")
-            else:
-                debug_print("Method 2 failed: no packages or no root package")
-
-            # Method 3: Search in all packages
-            if 'packages' in data:
-                debug_print(f"Checking packages structure...")
-                debug_print(f"Number of packages: {len(data['packages'])}")
-                debug_print(f"Available packages (first 10): {list(data['packages'].keys())[:10]}...")
-                if 'node_modules/electron' in data['packages']:
-                    electron_version = data['packages']['node_modules/electron']['version']
-                    debug_print(f"Found electron in packages: {electron_version}")
-                else:
-                    debug_print("node_modules/electron not found in packages")
-                    # Search for any electron-related packages
-                    electron_packages = [k for k in data['packages'].keys() if 'electron' in k.lower()]
-                    debug_print(f"Electron-related packages found: {electron_packages[:5]}")
-                    # Check if electron exists with different key format
-                    all_keys = list(data['packages'].keys())
-                    electron_keys = [k for k in all_keys if 'electron' in k]
-                    debug_print(f"All electron keys: {electron_keys}")
-
-            if electron_version:
-                # Extract major version number
-                major_version = electron_version.split('.')[0]
-                return f"electron{major_version}"
-            else:
-                raise ValueError("Electron dependency not found in package-lock.json")
-
-        except (requests.exceptions.RequestException, json.JSONDecodeError, ValueError) as e:
-            debug_print(f"Failed to get Electron version (attempt {attempt + 1}): {str(e)}")
-            if attempt < max_retries:
-                debug_print("Retrying in 2 seconds...")
-                import time
-                time.sleep(2)
-
-    debug_print("Failed to determine Electron version after all retries")
-    return None
-
+def appimage_url(commit, version):
+    """Return the downloads.cursor.com URL of the x86_64 AppImage for a release."""
+    return f"{DOWNLOADS_URL}/production/{commit}/linux/x64/Cursor-{version}-x86_64.AppImage"
 
-def extract_vscode_version_from_appimage(temp_file_path):
-    """Extract VSCode version from the AppImage using unsquashfs."""
-    try:
-        debug_print(f"Using existing temporary AppImage: {temp_file_path}")
 
-        # Use AppImage's own extraction method
-        debug_print("Extracting product.json using AppImage extraction...")
-        # Make the AppImage executable
-        os.chmod(temp_file_path, 0o755)
+def read_product_json_with_runtime(temp_file_path):
+    """Extract product.json by running the AppImage's own --appimage-extract."""
+    # Make the AppImage executable
+    os.chmod(temp_file_path, 0o755)
 
-        # Use the AppImage's --appimage-extract option
+    # Extract into a scratch directory so no squashfs-root/ is left behind
+    with tempfile.TemporaryDirectory() as work_dir:
         result = subprocess.run([
-            temp_file_path, '--appimage-extract', 'usr/share/cursor/resources/app/product.json'
-        ], capture_output=True, text=True, timeout=60)
+            os.path.abspath(temp_file_path), '--appimage-extract', PRODUCT_JSON_PATH
+        ], capture_output=True, text=True, timeout=60, cwd=work_dir)
 
         debug_print(f"AppImage extraction result: {result.returncode}")
         if result.stderr:
             debug_print(f"AppImage extraction stderr: {result.stderr}")
 
-        if result.returncode == 0:
-            product_json_path = 'squashfs-root/usr/share/cursor/resources/app/product.json'
-            if os.path.exists(product_json_path):
-                with open(product_json_path, 'r') as f:
-                    product_data = json.load(f)
-                vscode_version = product_data.get('vscodeVersion')
-                if vscode_version:
-                    debug_print(f"Found VSCode version: {vscode_version}")
-                    return vscode_version
-                else:
-                    debug_print("vscodeVersion not found in product.json")
-            else:
-                debug_print(f"product.json not found at: {product_json_path}")
+        product_json_path = os.path.join(work_dir, 'squashfs-root', PRODUCT_JSON_PATH)
+        if result.returncode != 0 or not os.path.exists(product_json_path):
+            debug_print(f"product.json not found at: {product_json_path}")
+            return None
+        with open(product_json_path, 'r') as f:
+            return json.load(f)
+
+
+@metrics.timed("extract")
+def inspect_appimage(temp_file_path):
+    """Return (VSCode version, Electron package or None) read from the AppImage itself."""
+    vscode_version = None
+    electron_version = None
+    try:
+        debug_print(f"Reading product.json from SquashFS in {temp_file_path}")
+        try:
+            fs = open_appimage(temp_file_path)
+            try:
+                debug_print(f"SquashFS at offset {fs.offset}, compression: {fs.compression}")
+                product_data = json.loads(fs.read_file(PRODUCT_JSON_PATH))
+                with metrics.span("electron_scan"):
+                    electron_version = electron_from_appimage(fs)
+            finally:
+                fs.close()
+        except SquashFSError as e:
+            debug_print(f"In-process SquashFS read failed ({e}), falling back to --appimage-extract")
+            product_data = read_product_json_with_runtime(temp_file_path)
+
+        vscode_version = product_data.get('vscodeVersion') if product_data else None
+        if vscode_version:
+            debug_print(f"Found VSCode version: {vscode_version}")
         else:
-            debug_print("AppImage extraction failed")
+            debug_print("vscodeVersion not found in product.json")
+        if electron_version:
+            debug_print(f"Found Electron version in AppImage: {electron_version}")
 
     except Exception as e:
-        debug_print(f"Error extracting VSCode version: {str(e)}")
+        debug_print(f"Error inspecting AppImage: {str(e)}")
+
+    return vscode_version, electron_version
+
+
+def reuse_local_appimage(path, known_sha512):
+    """Return (sha512, size, vscode_version, electron_version) of a local copy of a release.
+
+    The copy is only accepted if it hashes to ``known_sha512``; otherwise
+    None is returned.
+    """
+    debug_print(f"Found local AppImage {path}, verifying it instead of downloading")
+    graph = TaskGraph()
+    graph.add("local_hash", lambda: hash_appimage(path))
+    graph.add("inspect", lambda: inspect_appimage(path))
+    results = graph.run()
+
+    appimage_sha512, appimage_size = results["local_hash"]
+    if appimage_sha512 != known_sha512:
+        print(f"::warning::{path} does not match the known checksum of the release, downloading it instead")
+        return None
+    debug_print(f"Using local AppImage {path}, size: {appimage_size} bytes")
+    return (appimage_sha512, appimage_size) + tuple(results["inspect"])
+
+
+def download_and_inspect(url, new_commit, new_version, session):
+    """Download the AppImage at ``url`` and inspect it.
+
+    Returns (sha512, size, vscode_version, electron_version, speculative),
+    where ``speculative`` is a future of the (vscode_version,
+    electron_version) pair looked up over the network in the background,
+    or of None if that lookup failed.
+    """
+    # Stream the AppImage to disk once and use it for both SHA512 and extraction
+    debug_print(f"Downloading AppImage once for SHA512 and extraction: {url}")
+
+    # A stable path lets a later run resume an interrupted download from its .part file
+    download_dir = cache_path("downloads")
+    os.makedirs(download_dir, exist_ok=True)
+    temp_file_path = os.path.join(download_dir, f"Cursor-{new_version}-{new_commit}.AppImage")
+    for name in os.listdir(download_dir):
+        if not name.startswith(os.path.basename(temp_file_path)):
+            debug_print(f"Removing leftover partial download: {name}")
+            os.unlink(os.path.join(download_dir, name))
+
+    def download():
+        appimage_sha512, appimage_size = download_appimage(
+            url, temp_file_path, session=session, connections=DOWNLOAD_CONNECTIONS
+        )
+        metrics.current().bytes = appimage_size
+        return appimage_sha512, appimage_size
+
+    def speculative_electron():
+        # product.json sits in the first few hundred KB of metadata, so a handful of
+        # range requests get it long before the download finishes
+        with metrics.span("probe"):
+            vscode_version = probe_product_json(url, session).get("vscodeVersion")
+        return vscode_version, get_electron_version(vscode_version, session) if vscode_version else None
+
+    # The download dominates. The package-lock.json lookup starts beside it in the
+    # background and is only waited for if the AppImage scan finds no Electron version
+    graph = TaskGraph()
+    graph.add("download", download, connections=DOWNLOAD_CONNECTIONS)
+    graph.add("lockfile", speculative_electron, background=True)
+    graph.add("inspect", lambda _: inspect_appimage(temp_file_path), deps=["download"])
+    try:
+        results = graph.run()
+    finally:
+        # Clean up temporary file
+        if os.path.exists(temp_file_path):
+            os.unlink(temp_file_path)
+            debug_print(f"Cleaned up temporary file: {temp_file_path}")
+
+    appimage_sha512, appimage_size = results["download"]
+    debug_print(f"Calculated AppImage SHA512: {appimage_sha512}")
+    debug_print(f"Saved AppImage to {temp_file_path}, size: {appimage_size} bytes")
+    vscode_version, electron_version = results["inspect"]
+    return appimage_sha512, appimage_size, vscode_version, electron_version, results["lockfile"]
+
+
+def resolve_artifact(new_commit, new_version, pkgname=None, known_sha512=None, search_dirs=()):
+    """Return (sha512, electron_version) for a release, using the artifact cache when possible.
+
+    If ``known_sha512``, the checksum of the release, is already known, an
+    AppImage in ``search_dirs`` that hashes to it is used instead of
+    downloading the release again.
+    """
+    cached = get_artifact(new_commit, new_version)
+    if cached:
+        debug_print(f"Artifact cache hit for {new_commit} ({new_version}): {cached['size']} bytes, "
+                    f"VSCode {cached['vscode_version']}, {cached['electron_version']}")
+        return cached["sha512"], cached["electron_version"]
+
+    session = get_session()
+    url = appimage_url(new_commit, new_version)
+
+    # A local copy can only be trusted against a checksum already known for the commit
+    found = None
+    local_path = find_appimage(new_version, pkgname, search_dirs) if known_sha512 else None
+    if local_path:
+        found = reuse_local_appimage(local_path, known_sha512)
+    speculative = None
+    if found:
+        appimage_sha512, appimage_size, vscode_version, electron_version = found
+    else:
+        appimage_sha512, appimage_size, vscode_version, electron_version, speculative = download_and_inspect(
+            url, new_commit, new_version, session
+        )
+
+    looked_up = False
+    if electron_version is None and speculative is not None:
+        # Only now is the background lookup worth waiting for
+        probed_vscode, probed_electron = speculative.result() or (None, None)
+        vscode_version = vscode_version or probed_vscode
+        if probed_vscode and vscode_version == probed_vscode:
+            electron_version, looked_up = probed_electron, True
+    debug_print(f"VSCode version determined: {vscode_version}")
 
-    return None
+    if electron_version is None and vscode_version and not looked_up:
+        debug_print("Electron version not found in AppImage, falling back to VSCode package-lock.json...")
+        electron_version = get_electron_version(vscode_version, session)
+        debug_print(f"Determined Electron version: {electron_version}")
 
+    if electron_version is None:
+        debug_print("Could not determine Electron version, using fallback")
+        return appimage_sha512, "electron28"  # Fallback version, not cached so the next run retries
 
-def calculate_sha512(url):
-    """Download file and calculate its SHA512."""
-    print("::debug::Downloading file to calculate SHA512...")
-    print(f"::debug::URL: {url}")
+    put_artifact(new_commit, new_version, appimage_sha512, appimage_size, vscode_version, electron_version)
+    return appimage_sha512, electron_version
 
-    try:
-        response = requests.get(url, stream=True, timeout=30)
-        response.raise_for_status()
-        print(f"::debug::Download started, content-length: {response.headers.get('content-length', 'unknown')}")
-
-        sha512_hash = hashlib.sha512()
-        chunk_count = 0
-        for chunk in response.iter_content(chunk_size=8192):
-            sha512_hash.update(chunk)
-            chunk_count += 1
-            if chunk_count % 100 == 0:
-                print(f"::debug::Processed {chunk_count} chunks...")
-
-        print(f"::debug::Download completed, processed {chunk_count} chunks")
-        return sha512_hash.hexdigest()
-    except Exception as e:
-        print(f"::debug::Error calculating SHA512: {str(e)}")
-        raise
 
+def sha512_file(path):
+    sha512 = hashlib.sha512()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha512.update(chunk)
+    return sha512.hexdigest()
 
-def update_pkgbuild(pkgbuild_lines, json_data):
-    new_version = json_data["new_version"]
-    new_rel = json_data["new_rel"]
-    new_commit = json_data["new_commit"]
 
-    # Download AppImage once and use it for both SHA512 and extraction
-    appimage_url = f"https://downloads.cursor.com/production/{new_commit}/linux/x64/Cursor-{new_version}-x86_64.AppImage"
-    debug_print(f"Downloading AppImage once for SHA512 and extraction: {appimage_url}")
-
-    # Download the AppImage once and save to memory
-    response = requests.get(appimage_url, timeout=60)
-    response.raise_for_status()
-    appimage_data = response.content
-    response.close()
-
-    # Calculate SHA512
-    debug_print("Calculating SHA512...")
-    sha512_hash = hashlib.sha512()
-    sha512_hash.update(appimage_data)
-    appimage_sha512 = sha512_hash.hexdigest()
-    debug_print(f"Calculated AppImage SHA512: {appimage_sha512}")
+def update_local_checksums(pkgbuild, source_dir):
+    """Refresh sha512sums of sources shipped next to the PKGBUILD (entries without a URL)."""
+    sources = pkgbuild.find("source")
+    for index, word in enumerate(sources.words if sources else ()):
+        location = pkgbuild.expand(word).split("::", 1)[-1]
+        if "://" in location:
+            continue
+        checksum = sha512_file(os.path.join(source_dir, location))
+        debug_print(f"Checksum of local source {location}: {checksum}")
+        pkgbuild.set_item("sha512sums", index, checksum)
 
-    # Save the AppImage to a temporary file for extraction
-    debug_print("Saving AppImage to temporary file for extraction...")
-    with tempfile.NamedTemporaryFile(suffix='.AppImage', delete=False, mode='wb') as temp_file:
-        temp_file.write(appimage_data)
-        temp_file_path = temp_file.name
-    debug_print(f"Saved AppImage to {temp_file_path}, size: {len(appimage_data)} bytes")
 
-    # Determine Electron version
-    debug_print("Starting Electron version determination...")
-    vscode_version = extract_vscode_version_from_appimage(temp_file_path)
-    debug_print(f"VSCode version determined: {vscode_version}")
+def update_pkgbuild(pkgbuild_lines, json_data, source_dir="."):
+    pkgbuild = PKGBUILD.parse("".join(pkgbuild_lines))
+    update_model(pkgbuild, json_data, source_dir)
+    return pkgbuild.render().splitlines(keepends=True)
 
-    if vscode_version:
-        debug_print("Getting Electron version from VSCode package-lock.json...")
-        electron_version = get_electron_version(vscode_version)
-        debug_print(f"Determined Electron version: {electron_version}")
-        if electron_version is None:
-            debug_print("Electron version is None, using fallback")
-            electron_version = "electron28"  # Fallback version
-    else:
-        debug_print("Could not determine Electron version, using fallback")
-        electron_version = "electron28"  # Fallback version
-
-    updated_lines = []
-    in_sha = False
-
-    for line in pkgbuild_lines:
-        if line.startswith("pkgver="):
-            updated_lines.append(f"pkgver={new_version}\n")
-        elif line.startswith("pkgrel="):
-            updated_lines.append(f"pkgrel={new_rel}\n")
-        elif line.startswith("_commit="):
-            updated_lines.append(f"_commit={new_commit}\n")
-        elif line.startswith("source="):
-            # Update the source line with the new commit and version
-            updated_lines.append(f'source=("${{_appimage}}::https://downloads.cursor.com/production/{new_commit}/linux/x64/Cursor-{new_version}-x86_64.AppImage"\n')
-        elif line.startswith("https://gitlab.archlinux.org"):
-            # This is the second source line (code.sh)
-            updated_lines.append(line)
-        elif line.startswith("sha512sums="):
-            updated_lines.append(f"sha512sums=('{appimage_sha512}'\n")
-            in_sha = True
-        elif in_sha and line.strip().endswith(")"):
-            # This is the last line of sha512sums, add the second checksum
-            updated_lines.append(f"            '937299c6cb6be2f8d25f7dbc95cf77423875c5f8353b8bd6cd7cc8e5603cbf8405b14dbf8bd615db2e3b36ed680fc8e1909410815f7f8587b7267a699e00ab37')\n")
-            in_sha = False
-        elif line.startswith("  # Electron version determined during build process"):
-            # Keep the comment
-            updated_lines.append(line)
-        elif line.startswith("  _electron="):
-            # Update the electron version
-            updated_lines.append(f"  _electron={electron_version}\n")
-        elif line.startswith("  echo $_electron"):
-            # Keep the echo line
-            updated_lines.append(line)
-        elif not in_sha:
-            updated_lines.append(line)
-
-    # Clean up temporary file
-    if os.path.exists(temp_file_path):
-        os.unlink(temp_file_path)
-        debug_print(f"Cleaned up temporary file: {temp_file_path}")
-
-    return updated_lines
+
+@metrics.timed("update")
+def update_model(pkgbuild, json_data, source_dir="."):
+    """Apply the release described by ``json_data`` to a parsed PKGBUILD in place."""
+    new_version = json_data["new_version"]
+    new_rel = json_data["new_rel"]
+    new_commit = json_data["new_commit"]
+
+    url = appimage_url(new_commit, new_version)
+    # Re-packaging the pinned commit (a pkgrel bump) means its checksum is already known
+    known_sha512 = None
+    if pkgbuild.get("_commit") == new_commit:
+        known_sha512 = (pkgbuild.get("sha512sums") or [None])[0]
+    appimage_sha512, electron_version = resolve_artifact(
+        new_commit, new_version, pkgbuild.get("pkgname"), known_sha512, search_dirs([source_dir])
+    )
+
+    with metrics.span("render"):
+        pkgbuild.set("pkgver", new_version)
+        pkgbuild.set("pkgrel", new_rel)
+        pkgbuild.set("_commit", new_commit)
+        # Only the AppImage entry changes; other sources keep their checksums
+        pkgbuild.set_item("source", 0, f"${{_appimage}}::{url}")
+        pkgbuild.set_item("sha512sums", 0, appimage_sha512)
+        pkgbuild.set("_electron", electron_version, function="package")
+        update_local_checksums(pkgbuild, source_dir)
+
+
+def apply_update(check_output, path="PKGBUILD"):
+    """Rewrite the PKGBUILD at ``path`` for the release described by ``check_output``."""
+    debug_print("Update needed, reading current PKGBUILD")
+    with open(path, "r") as f:
+        current_pkgbuild = f.readlines()
+
+    debug_print("Calling update_pkgbuild()")
+    updated_pkgbuild = update_pkgbuild(current_pkgbuild, check_output, os.path.dirname(os.path.abspath(path)))
+
+    # Write the changes to the file
+    with open(path, "w") as f:
+        f.writelines(updated_pkgbuild)
+    metrics.mark_release_updated(check_output["new_commit"])
+    debug_print(
+        f"PKGBUILD updated to version {check_output['new_version']} (release {check_output['new_rel']}) with commit {check_output['new_commit']}"
+    )
 
 
 if __name__ == "__main__":
@@ -262,31 +298,27 @@ if __name__ == "__main__":
         print("Usage: python update_pkgbuild.py <check_output_file>")
         sys.exit(1)
 
+    if metrics.PROFILE:
+        metrics.start_profiling(metrics.MEMORY_BUDGET)
     try:
-        debug_print(f"Reading check output from {sys.argv[1]}")
-        with open(sys.argv[1], "r") as f:
-            check_output = json.load(f)
-
-        debug_print(f"Check output content: {json.dumps(check_output, indent=2)}")
-
-        if check_output["update_needed"]:
-            debug_print("Update needed, reading current PKGBUILD")
-            with open("PKGBUILD", "r") as f:
-                current_pkgbuild = f.readlines()
-
-            debug_print("Calling update_pkgbuild()")
-            updated_pkgbuild = update_pkgbuild(current_pkgbuild, check_output)
-
-            # Write the changes to the file
-            with open("PKGBUILD", "w") as f:
-                f.writelines(updated_pkgbuild)
-            debug_print(
-                f"PKGBUILD updated to version {check_output['new_version']} (release {check_output['new_rel']}) with commit {check_output['new_commit']}"
-            )
-        else:
-            print("No update needed.")
+        try:
+            debug_print(f"Reading check output from {sys.argv[1]}")
+            with open(sys.argv[1], "r") as f:
+                check_output = json.load(f)
+
+            debug_print(f"Check output content: {json.dumps(check_output, indent=2)}")
+
+            if check_output["update_needed"]:
+                apply_update(check_output)
+            else:
+                print("No update needed.")
+        finally:
+            summary = metrics.stop_profiling()
+        metrics.check_memory_budget(summary)
     except Exception as e:
-        debug_print(f"Error in main execution: {str(e)}")
+        print(f"::error::Error in main execution: {str(e)}")
         import traceback
         debug_print(f"Traceback: {traceback.format_exc()}")
         sys.exit(1)
+    finally:
+        metrics.emit()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""Single-process entry point: check for a new release and update the PKGBUILD.
+
+``python updater.py run`` does what ``python check.py`` followed by
+``python update_pkgbuild.py check_output.json`` does, in one interpreter:
+the PKGBUILD is parsed once and the same model is checked, updated and
+saved, and one pooled HTTP session serves the Cursor API, AUR, the
+AppImage download and the Electron lookup. ``check_output.json`` is still
+written for anything that reads it.
+
+The same is available to other code as :func:`run`.
+"""
+import argparse
+import json
+import os
+import sys
+
+import metrics
+from check import run_check, write_check_output
+from net import get_session
+from pkgbuild import PKGBUILD
+
+
+def run(pkgbuild_path="PKGBUILD", check_output_path="check_output.json", session=None):
+    """Check for an update, apply it to ``pkgbuild_path`` if needed and return the check output.
+
+    Pass ``check_output_path=None`` to skip writing ``check_output.json``.
+    """
+    session = session or get_session()
+    pkgbuild = PKGBUILD.load(pkgbuild_path)
+    output = run_check(session, pkgbuild)
+    if check_output_path:
+        write_check_output(output, check_output_path)
+
+    if not output["update_needed"]:
+        print("No update needed.")
+        return output
+
+    # Only runs that actually update need the download/extraction machinery
+    from update_pkgbuild import update_model
+
+    update_model(pkgbuild, output, os.path.dirname(os.path.abspath(pkgbuild_path)))
+    pkgbuild.save(pkgbuild_path)
+    metrics.mark_release_updated(output["new_commit"])
+    print(
+        f"::debug::PKGBUILD updated to version {output['new_version']} (release {output['new_rel']})"
+        f" with commit {output['new_commit']}"
+    )
+    return output
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check for a new Cursor release and update the PKGBUILD")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="check and, if needed, update in one process")
+    run_parser.add_argument("--pkgbuild", default="PKGBUILD")
+    run_parser.add_argument("--check-output", default="check_output.json",
+                            help="where to write the check output ('' to skip)")
+    run_parser.add_argument("--profile", action="store_true", default=metrics.PROFILE,
+                            help="record peak RSS, traced memory and top allocation sites per phase")
+    run_parser.add_argument("--memory-budget", default=metrics.MEMORY_BUDGET, metavar="SIZE",
+                            help="with --profile, fail if peak RSS exceeds SIZE (e.g. 256M)")
+    args = parser.parse_args(argv)
+
+    if args.profile:
+        metrics.start_profiling(args.memory_budget)
+    try:
+        output = run(args.pkgbuild, args.check_output or None)
+    finally:
+        summary = metrics.stop_profiling()
+    print(f"::debug::Run output: {json.dumps(output)}")
+    metrics.check_memory_budget(summary)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        print(f"::error::Error in main execution: {str(e)}")
+        sys.exit(1)
+    finally:
+        metrics.emit()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""Long-running watcher that updates the PKGBUILD as soon as Cursor ships.
+
+Each tick makes one conditional request to the Cursor download API. Only
+when the returned ``commitSha`` differs from the last one seen does the
+full check run (AUR lookup, version comparison); if an update is needed
+the PKGBUILD is rewritten, ``check_output.json`` is written and the
+optional ``--on-update`` command is run.
+
+The poll interval adapts to release cadence: it is a twelfth of the time
+since the last release seen, clamped to ``--min-interval``/``--max-interval``,
+so the watcher polls often right after a release (when follow-up builds
+are likely) and backs off during quiet periods. Failures back off
+exponentially with jitter up to the maximum interval.
+
+A lockfile ensures only one watcher runs against a cache directory.
+
+Usage: python watch.py [--min-interval S] [--max-interval S] [--on-update CMD]
+"""
+import argparse
+import fcntl
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+import metrics
+from cache import cache_path, load_json, store_json
+from check import (
+    DEFAULT_PLATFORM,
+    DEFAULT_RELEASE_TRACK,
+    get_latest_commit_and_version,
+    run_check,
+    write_check_output,
+)
+from net import backoff_delay, get_session
+from pkgbuild import PKGBUILD
+from update_pkgbuild import apply_update
+
+STATE_FILE = "watch_state.json"
+LOCK_FILE = "watch.lock"
+
+MIN_INTERVAL = 120
+# Upper bound on the poll interval, so a release is detected within minutes even
+# after a long quiet period
+MAX_INTERVAL = 300
+# Poll interval as a fraction of the time since the last release
+CADENCE_DIVISOR = 12
+
+
+class WatchLockedError(Exception):
+    """Another watcher holds the lockfile."""
+
+
+def acquire_lock(path):
+    """Take an exclusive, non-blocking lock on ``path``; keep the returned file open."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    lock_file = open(path, "a+")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        raise WatchLockedError(f"Another watcher is running (lock held on {path})")
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(f"{os.getpid()}\n")
+    lock_file.flush()
+    return lock_file
+
+
+def next_interval(last_release_at, now, min_interval=MIN_INTERVAL, max_interval=MAX_INTERVAL):
+    """Seconds until the next poll given the time of the last release seen."""
+    if last_release_at is None:
+        return min_interval
+    return max(min_interval, min(max_interval, (now - last_release_at) / CADENCE_DIVISOR))
+
+
+class Watcher:
+    def __init__(self, args, session=None):
+        self.args = args
+        self.session = session or get_session()
+        self.stop = threading.Event()
+        self.state = load_json(STATE_FILE)
+        self.failures = 0
+
+    def _save_state(self):
+        store_json(STATE_FILE, self.state)
+
+    def _run_update(self):
+        output = run_check(
+            self.session, PKGBUILD.load(self.args.pkgbuild), self.args.platform, self.args.release_track
+        )
+        if not output["update_needed"]:
+            print("::debug::New commit seen but no update needed")
+            return
+        apply_update(output, self.args.pkgbuild)
+        write_check_output(output)
+        print(f"Updated PKGBUILD to {output['new_version']}-{output['new_rel']} ({output['new_commit']})")
+        if self.args.on_update:
+            result = subprocess.run(self.args.on_update, shell=True)
+            if result.returncode != 0:
+                print(f"::warning::--on-update command exited with {result.returncode}")
+
+    def tick(self):
+        """Poll once; return the number of seconds to wait before the next poll."""
+        commit, latest_version, _ = get_latest_commit_and_version(
+            self.session, self.args.platform, self.args.release_track, max_retries=0
+        )
+        if not commit:
+            raise requests.exceptions.RequestException("Cursor API did not return a commit")
+
+        now = time.time()
+        if commit != self.state.get("commit"):
+            print(f"::debug::Commit changed: {self.state.get('commit')} -> {commit} ({latest_version})")
+            self._run_update()
+            if self.state.get("commit") is not None:
+                self.state["last_release_at"] = now
+            self.state["commit"] = commit
+            self.state.setdefault("last_release_at", now)
+            self._save_state()
+        return next_interval(self.state.get("last_release_at"), now, self.args.min_interval, self.args.max_interval)
+
+    def run(self):
+        while not self.stop.is_set():
+            try:
+                delay = self.tick()
+                self.failures = 0
+            except Exception as e:
+                # A failed tick, whatever the cause (e.g. a dropped download), only backs off
+                delay = min(self.args.max_interval, max(self.args.min_interval / 4, backoff_delay(self.failures)))
+                self.failures += 1
+                print(f"::warning::Watch tick failed ({self.failures} in a row): {str(e)}")
+            finally:
+                # Each tick is its own run; don't let the report grow without bound
+                metrics.emit(append=False)
+                metrics.reset()
+            print(f"::debug::Next poll in {delay:.0f} seconds")
+            self.stop.wait(delay)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Watch for new Cursor releases and update the PKGBUILD")
+    parser.add_argument("--platform", default=DEFAULT_PLATFORM)
+    parser.add_argument("--release-track", default=DEFAULT_RELEASE_TRACK)
+    parser.add_argument("--pkgbuild", default="PKGBUILD")
+    parser.add_argument("--min-interval", type=float, default=MIN_INTERVAL, help="shortest poll interval in seconds")
+    parser.add_argument("--max-interval", type=float, default=MAX_INTERVAL, help="longest poll interval in seconds")
+    parser.add_argument("--on-update", metavar="CMD", help="shell command to run after the PKGBUILD is updated")
+    parser.add_argument("--lockfile", default=cache_path(LOCK_FILE))
+    args = parser.parse_args(argv)
+
+    lock = acquire_lock(args.lockfile)
+    watcher = Watcher(args)
+
+    def handle_signal(signum, frame):
+        print(f"::debug::Received signal {signum}, stopping")
+        watcher.stop.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+    try:
+        watcher.run()
+    finally:
+        lock.close()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except WatchLockedError as e:
+        print(f"::error::{str(e)}")
+        sys.exit(1)